@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import logging
+import time
+from consumer import decode_frame
+from config import DESCRIPTION_WORKERS, MOSAIC_MAX_TILES
+from frame_recorder import read_segment
+from image_processing import ImageProcessor
+from replay import find_segments
+
+logger = logging.getLogger(__name__)
+
+
+def load_frames(segments, count):
+    # The newest recorded frames, at most one per camera per round, like a burst of cameras changing at once
+    per_segment = []
+    for segment in segments:
+        frames = []
+        for _, payload in read_segment(segment):
+            try:
+                camera_id, _, _, _, img = decode_frame(bytes(payload))
+            except Exception as e:
+                logger.warning(f"Skipping undecodable frame in {segment}: {str(e)}")
+                continue
+            frames.append((camera_id, img))
+        per_segment.append(frames[-count:])
+
+    frames = []
+    while len(frames) < count and any(per_segment):
+        for segment_frames in per_segment:
+            if segment_frames and len(frames) < count:
+                frames.append(segment_frames.pop())
+    return frames
+
+
+async def bench_per_frame(frames, workers):
+    processor = ImageProcessor()
+    queue = list(frames)
+    described = 0
+
+    async def worker():
+        nonlocal described
+        while queue:
+            camera_id, img = queue.pop()
+            description, confidence = await processor.describe(camera_id, img)
+            if description is not None and confidence is not None:
+                described += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return described, len(frames), time.perf_counter() - start
+
+
+async def bench_mosaic(frames, tiles, workers):
+    processor = ImageProcessor()
+    queue = [frames[i:i + tiles] for i in range(0, len(frames), tiles)]
+    described = 0
+
+    async def worker():
+        nonlocal described
+        while queue:
+            described += len(await processor.describe_mosaic(queue.pop()))
+
+    calls = len(queue)
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return described, calls, time.perf_counter() - start
+
+
+def result(mode, frames, described, calls, seconds):
+    return {
+        'mode': mode,
+        'frames': frames,
+        'described': described,
+        'vision_calls': calls,
+        'seconds': round(seconds, 3),
+        'frames_per_second': round(described / seconds, 3) if seconds > 0 else None,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare frames described per second by per-frame and mosaic vision calls")
+    parser.add_argument('paths', nargs='+', help="segment files or recording directories")
+    parser.add_argument('--cameras', nargs='*', help="only use these camera ids")
+    parser.add_argument('--frames', type=int, default=18, help="frames to describe with each method")
+    parser.add_argument('--tiles', type=int, nargs='*', default=[MOSAIC_MAX_TILES], help="one mosaic run per tile count")
+    parser.add_argument('--workers', type=int, default=DESCRIPTION_WORKERS, help="concurrent vision requests")
+    args = parser.parse_args()
+
+    segments = find_segments(args.paths, args.cameras)
+    if not segments:
+        parser.error("no segment files found")
+    frames = load_frames(segments, args.frames)
+    if not frames:
+        parser.error("no decodable frames found")
+
+    # Runs against the configured vision server
+    described, calls, seconds = await bench_per_frame(frames, args.workers)
+    print(result('per_frame', len(frames), described, calls, seconds))
+    for tiles in args.tiles:
+        described, calls, seconds = await bench_mosaic(frames, tiles, args.workers)
+        print(result(f'mosaic_{tiles}', len(frames), described, calls, seconds))
+
+
+if __name__ == "__main__":
+    # consumer configures INFO logging on import
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(main())
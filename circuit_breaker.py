@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import random
+import time
+from config import LLM_FAILURE_THRESHOLD, LLM_TIMEOUT, LLM_MIN_TIMEOUT, LLM_MAX_TIMEOUT, LLM_RECOVERY_TIME, LLM_MAX_RECOVERY_TIME
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def jittered_backoff(attempt, base_delay, max_delay=LLM_MAX_RECOVERY_TIME):
+    # Exponential backoff with jitter in [delay/2, delay] so instances don't retry in lockstep
+    delay = min(max_delay, base_delay * 2 ** max(attempt - 1, 0))
+    return random.uniform(delay / 2, delay)
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=LLM_FAILURE_THRESHOLD, timeout=LLM_TIMEOUT,
+                 min_timeout=LLM_MIN_TIMEOUT, max_timeout=LLM_MAX_TIMEOUT,
+                 recovery_time=LLM_RECOVERY_TIME, max_recovery_time=LLM_MAX_RECOVERY_TIME):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.recovery_time = recovery_time
+        self.max_recovery_time = max_recovery_time
+        self.state = CLOSED
+        self.failures = 0
+        self.consecutive_opens = 0
+        self.open_until = 0
+        self.probe_in_flight = False
+        # Latency estimate used for the adaptive timeout (same scheme as TCP's RTO)
+        self.timeout = timeout
+        self.avg_latency = None
+        self.latency_deviation = 0.0
+
+    @property
+    def is_available(self):
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return time.monotonic() >= self.open_until
+        return not self.probe_in_flight
+
+    def allow_request(self):
+        if self.state == OPEN and time.monotonic() >= self.open_until:
+            logger.info(f"Circuit '{self.name}' half-open, sending probe request")
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+            return True
+        return self.state == CLOSED
+
+    def record_success(self, latency):
+        if self.state != CLOSED:
+            logger.info(f"Circuit '{self.name}' closed, server recovered")
+        self.state = CLOSED
+        self.failures = 0
+        self.consecutive_opens = 0
+        self.probe_in_flight = False
+
+        if self.avg_latency is None:
+            self.avg_latency = latency
+            self.latency_deviation = latency / 2
+        else:
+            self.latency_deviation = 0.75 * self.latency_deviation + 0.25 * abs(latency - self.avg_latency)
+            self.avg_latency = 0.875 * self.avg_latency + 0.125 * latency
+        self.timeout = min(self.max_timeout, max(self.min_timeout, self.avg_latency + 4 * self.latency_deviation))
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.trip()
+
+    def trip(self):
+        self.consecutive_opens += 1
+        delay = jittered_backoff(self.consecutive_opens, self.recovery_time, self.max_recovery_time)
+        self.state = OPEN
+        self.open_until = time.monotonic() + delay
+        # Give a slow server more room on the probe
+        self.timeout = min(self.max_timeout, self.timeout * 2)
+        logger.warning(f"Circuit '{self.name}' open after {self.failures} failures, next probe in {delay:.1f}s")
+
+    async def call(self, func, *args, **kwargs):
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(func(*args, **kwargs), timeout=self.timeout)
+        except asyncio.CancelledError:
+            self.probe_in_flight = False
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success(time.monotonic() - start)
+        return result
@@ -1,3 +1,4 @@
+import json
 import os
 
 # Redis configuration
@@ -7,18 +8,79 @@ REDIS_QUEUE = os.getenv('REDIS_QUEUE', 'frame_queue')
 REDIS_CAMERA_CHANNEL = 'camera_processing'
 REDIS_STATE_CHANNEL = 'state_processing'
 REDIS_STATE_RESULT_CHANNEL = 'state_result'
+REDIS_PROFILE_CHANNEL = 'profile_requests'
 
 # Database configuration
 DB_HOST = os.getenv('DB_HOST', '192.168.0.71')
 DB_NAME = os.getenv('DB_NAME', 'visionmon')
 DB_USER = os.getenv('DB_USER', 'pguser')
 DB_PASSWORD = os.getenv('DB_PASSWORD', 'pgpass')
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', "4"))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', "10"))
+# Descriptions are deduplicated in visionmon_descriptions and still written to visionmon_metadata.description,
+# which other readers of the table rely on; only turn this off once none of them read the inline column
+STORE_INLINE_DESCRIPTIONS = os.getenv('STORE_INLINE_DESCRIPTIONS', 'true').lower() == 'true'
 
 # OpenAI configuration
 OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'http://192.168.0.55:1234/v1')
 OPENAI_VISION_URL = os.getenv('OPENAI_VISION_URL', OPENAI_BASE_URL)
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', 'lm-studio')
 
+# Circuit breaker around the LLM servers
+LLM_FAILURE_THRESHOLD = int(os.getenv('LLM_FAILURE_THRESHOLD', "3"))  # consecutive failures before the circuit opens
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', "30"))  # initial request timeout in seconds, adapted to observed latency
+LLM_MIN_TIMEOUT = float(os.getenv('LLM_MIN_TIMEOUT', "5"))
+LLM_MAX_TIMEOUT = float(os.getenv('LLM_MAX_TIMEOUT', "120"))
+LLM_RECOVERY_TIME = float(os.getenv('LLM_RECOVERY_TIME', "5"))  # first wait before probing an open circuit
+LLM_MAX_RECOVERY_TIME = float(os.getenv('LLM_MAX_RECOVERY_TIME', "300"))
+
+# Stream vision completions, forwarding partial descriptions as sentences complete
+VISION_STREAMING = os.getenv('VISION_STREAMING', 'false').lower() == 'true'
+VISION_MAX_SENTENCES = int(os.getenv('VISION_MAX_SENTENCES', "0"))  # stop generation after this many sentences, 0 = no limit
+
+# Batched change detection: all pending frames are downscaled and compared in one vectorized SSIM pass
+BATCH_DETECTION = os.getenv('BATCH_DETECTION', 'false').lower() == 'true'
+BATCH_DETECTION_SIZE = (int(os.getenv('BATCH_DETECTION_WIDTH', "160")), int(os.getenv('BATCH_DETECTION_HEIGHT', "90")))
+# Applies to SSIM of the downscaled frames, not the full-resolution SSIM of the per-frame path. Downscaling
+# averages away noise but makes a changed region cover more of each SSIM window, so the same change drops
+# SSIM about 2-3x further here; 0.90 corresponds to the per-frame 0.95
+BATCH_SSIM_THRESHOLD = float(os.getenv('BATCH_SSIM_THRESHOLD', "0.90"))
+# Seconds between batch passes. Each pass updates every assigned camera and counts as a full round for
+# state processing, so this matches the ~20s per camera of the one-camera-per-iteration loop
+BATCH_INTERVAL = float(os.getenv('BATCH_INTERVAL', "20"))
+
+# Crop to motion: describe only the regions that changed, plus a small thumbnail of the whole scene
+CROP_TO_MOTION = os.getenv('CROP_TO_MOTION', 'false').lower() == 'true'
+MOTION_DIFF_THRESHOLD = int(os.getenv('MOTION_DIFF_THRESHOLD', "25"))  # grey levels a pixel must change by
+MOTION_MIN_AREA = int(os.getenv('MOTION_MIN_AREA', "400"))  # pixels, smaller regions are treated as noise
+MOTION_MAX_BOXES = int(os.getenv('MOTION_MAX_BOXES', "3"))  # more regions than this are merged into one crop
+MOTION_PADDING = int(os.getenv('MOTION_PADDING', "32"))  # pixels of context around each region
+MOTION_MAX_CROP_FRACTION = float(os.getenv('MOTION_MAX_CROP_FRACTION', "0.6"))  # larger crops send the full frame
+MOTION_THUMBNAIL_WIDTH = int(os.getenv('MOTION_THUMBNAIL_WIDTH', "320"))  # 0 = no full-scene thumbnail
+
+# Priority scheduling of changed frames waiting for a description
+PRIORITY_SCHEDULING = os.getenv('PRIORITY_SCHEDULING', 'false').lower() == 'true'
+DESCRIPTION_WORKERS = int(os.getenv('DESCRIPTION_WORKERS', "1"))  # concurrent vision requests
+FRAME_DEADLINE = float(os.getenv('FRAME_DEADLINE', "120"))  # seconds a frame may wait before it is dropped
+FRAME_AGE_HALF_LIFE = float(os.getenv('FRAME_AGE_HALF_LIFE', "30"))  # seconds of waiting that halve a frame's priority
+# Relative weight per camera_id, default 1.0, e.g. {"AXIS_ID": 2.0}
+CAMERA_IMPORTANCE = json.loads(os.getenv('CAMERA_IMPORTANCE', '{}'))
+
+# Mosaic mode: with priority scheduling, a backlog of changed frames is tiled into one image and described in one call
+MOSAIC_MODE = os.getenv('MOSAIC_MODE', 'false').lower() == 'true'
+MOSAIC_MIN_FRAMES = int(os.getenv('MOSAIC_MIN_FRAMES', "4"))  # queued frames needed before a mosaic is built
+MOSAIC_MAX_TILES = int(os.getenv('MOSAIC_MAX_TILES', "9"))
+MOSAIC_TILE_SIZE = (int(os.getenv('MOSAIC_TILE_WIDTH', "448")), int(os.getenv('MOSAIC_TILE_HEIGHT', "252")))
+
+# Record ingested frames to per-camera segment files for offline replay, empty = disabled
+RECORD_DIR = os.getenv('RECORD_DIR', '')
+
+# On-demand profiling, triggered via REDIS_PROFILE_CHANNEL or SIGUSR1
+PROFILE_DIR = os.getenv('PROFILE_DIR', '/tmp/frameconsumer-profiles')
+PROFILE_SECONDS = float(os.getenv('PROFILE_SECONDS', "30"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', "0.005"))
+PROFILE_SLOW_CALLBACK = float(os.getenv('PROFILE_SLOW_CALLBACK', "0.1"))  # seconds a callback may block the loop
+
 # Django WebSocket URL
 DJANGO_WEBSOCKET_URL = os.getenv('DJANGO_WEBSOCKET_URL', 'ws://localhost:8001/ws/llm_output/')
 
@@ -28,6 +90,51 @@ MODULUS = int(os.getenv('MODULUS', "1"))
 INSTANCE_INDEX = int(os.getenv('INSTANCE_INDEX', "0"))
 ADDITIONAL_INDEX = int(os.getenv('ADDITIONAL_INDEX', "2"))
 
+# LLM response cache for the state prompts
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', "3600"))  # seconds
+LLM_CACHE_SIZE = int(os.getenv('LLM_CACHE_SIZE', "1024"))
+LLM_CACHE_USE_REDIS = os.getenv('LLM_CACHE_USE_REDIS', 'false').lower() == 'true'
+LLM_CACHE_REDIS_PREFIX = 'llm_cache:'
+LLM_CACHE_STATS_KEY = 'llm_cache_stats'
+
+# Schedule rules, compiled once at startup by time_windows.ScheduleEngine
+TIME_ZONE = os.getenv('TIME_ZONE', 'America/New_York')
+
+# Nightly (start, end) windows, end inclusive; windows may cross midnight
+NIGHT_TIME_WINDOWS = [("20:00", "02:59")]
+
+# Per-camera windows where the camera state is always "nothing": (start, end, weekdays), end inclusive, Monday=0
+QUIET_WINDOWS = {
+    "AXIS_ID": [
+        ("04:30", "05:00", range(7)),
+        ("07:15", "12:00", range(7)),
+        ("12:30", "13:00", range(7)),
+        ("19:00", "20:00", range(7)),
+        ("13:00", "16:00", [6]),
+        ("16:15", "17:45", range(6)),
+        ("16:00", "16:30", [6]),
+    ],
+}
+
+# Curtain checks: (camera_id, label, start, end), end inclusive, evaluated once when the window closes
+CURTAIN_CHECK_WINDOWS = [
+    ("AXIS_ID", "12:33pm", "12:33", "12:38"),
+    ("AXIS_ID", "4:18pm", "16:18", "16:22"),
+    ("AXIS_ID", "7:03pm", "19:03", "19:08"),
+]
+CURTAIN_KEYWORDS = ["deities", "statues", "deity", "figures", "figure"]
+
+# Latest per-camera values, kept in memory from the write path and optionally mirrored to the facility snapshot
+LATEST_CACHE_USE_REDIS = os.getenv('LATEST_CACHE_USE_REDIS', 'false').lower() == 'true'
+# Redis hash with the current picture: per-camera description, timestamp and state, facility state and a version
+FACILITY_SNAPSHOT_KEY = 'facility_snapshot'
+
+# Local camera-state classifier that runs before the LLM
+STATE_CLASSIFIER_ENABLED = os.getenv('STATE_CLASSIFIER_ENABLED', 'true').lower() == 'true'
+STATE_CLASSIFIER_MODEL = os.getenv('STATE_CLASSIFIER_MODEL', '')  # optional pickled scikit-learn pipeline
+STATE_CLASSIFIER_THRESHOLD = float(os.getenv('STATE_CLASSIFIER_THRESHOLD', "0.9"))
+
 # Camera information
 camera_names = {
     "I6Dvhhu1azyV9rCu": "Audio_Visual", "oaQllpjP0sk94nCV": "Bhoga_Shed", "PxnDZaXu2awYbMmS": "Back_Driveway",
@@ -0,0 +1,40 @@
+import pytest
+
+
+class FakeTransaction:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.commands = []
+
+    def hmset_dict(self, key, fields):
+        self.commands.append(lambda: self.redis_client.hash.update(fields) or True)
+
+    def hincrby(self, key, field, increment):
+        def incr():
+            self.redis_client.hash[field] = str(int(self.redis_client.hash.get(field, 0)) + increment)
+            return int(self.redis_client.hash[field])
+        self.commands.append(incr)
+
+    async def execute(self):
+        return [command() for command in self.commands]
+
+
+class FakeRedis:
+    # The parts of an aioredis client used for the facility snapshot hash
+    def __init__(self):
+        self.hash = {}
+
+    def multi_exec(self):
+        return FakeTransaction(self)
+
+    async def hmset_dict(self, key, fields):
+        self.hash.update(fields)
+        return True
+
+    async def hgetall(self, key):
+        return {field.encode(): str(value).encode() for field, value in self.hash.items()}
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import time
+from db_operations import connect_database, connect_pool
+from redis_operations import connect_redis
+from websocket_operations import connect_websocket
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceRegistry:
+    def __init__(self):
+        self.redis = None
+        self.db_conn = None
+        self.pool = None
+        self.websocket = None
+        self.connected = False
+        self.connect_lock = asyncio.Lock()
+
+    @property
+    def is_ready(self):
+        return self.connected
+
+    async def connect(self):
+        # Safe to call from every module; only the first caller actually connects
+        async with self.connect_lock:
+            if self.is_ready:
+                return self
+            start = time.monotonic()
+            tasks = {
+                'redis': asyncio.ensure_future(connect_redis()),
+                'db_conn': asyncio.ensure_future(connect_database()),
+                'pool': asyncio.ensure_future(connect_pool()),
+                'websocket': asyncio.ensure_future(connect_websocket()),
+            }
+            try:
+                await asyncio.gather(*tasks.values())
+            except BaseException:
+                # Stop the backends still connecting and close the ones that made it, so a retry starts clean
+                for task in tasks.values():
+                    task.cancel()
+                await asyncio.gather(*tasks.values(), return_exceptions=True)
+                for name, task in tasks.items():
+                    if not task.cancelled() and task.exception() is None:
+                        setattr(self, name, task.result())
+                await self.close()
+                raise
+            for name, task in tasks.items():
+                setattr(self, name, task.result())
+            self.connected = True
+            logger.info(f"All backends connected in {time.monotonic() - start:.2f}s")
+        return self
+
+    async def close(self):
+        # Idempotent: each client is taken out of the registry before it is closed
+        self.connected = False
+        redis, db_conn, pool, websocket = self.redis, self.db_conn, self.pool, self.websocket
+        self.redis = self.db_conn = self.pool = self.websocket = None
+        if websocket is not None:
+            await websocket.close()
+        if pool is not None:
+            await pool.close()
+        if redis is not None:
+            redis.close()
+            await redis.wait_closed()
+        if db_conn is not None:
+            db_conn.close()
+        if any(client is not None for client in (redis, db_conn, pool, websocket)):
+            logger.info("Closed all backend connections")
+
+resources = ResourceRegistry()
@@ -1,6 +1,4 @@
 import asyncio
-import aioredis
-import asyncpg
 import time
 import json
 import logging
@@ -10,13 +8,20 @@ import base64
 import ast
 import cv2
 import numpy as np
-from config import REDIS_HOST, REDIS_PORT, REDIS_QUEUE, DB_HOST, DB_NAME, DB_USER, DB_PASSWORD, REDIS_STATE_CHANNEL, PROCESS_STATE, camera_names, CAMERA_IDS, MODULUS, INSTANCE_INDEX, ADDITIONAL_INDEX
-from db_operations import connect_database, store_results, update_timestamp
-from redis_operations import connect_redis, get_frame
+from config import REDIS_STATE_CHANNEL, REDIS_PROFILE_CHANNEL, PROCESS_STATE, RECORD_DIR, BATCH_DETECTION, BATCH_INTERVAL, PRIORITY_SCHEDULING, DESCRIPTION_WORKERS, MOSAIC_MODE, MOSAIC_MIN_FRAMES, MOSAIC_MAX_TILES, LLM_CACHE_USE_REDIS, LATEST_CACHE_USE_REDIS, camera_names, CAMERA_IDS, MODULUS, INSTANCE_INDEX, ADDITIONAL_INDEX
+from db_operations import store_results, update_timestamp
+from connections import resources
 from state_processing import process_state
-from websocket_operations import connect_websocket, send_to_django
+from websocket_operations import send_to_django
 from image_processing import ImageProcessor
-from scheduled_checks import schedule_checks
+from openai_operations import vision_breaker
+from circuit_breaker import jittered_backoff
+from scheduled_checks import schedule_checks, curtain_check_engine
+from llm_cache import llm_cache
+from latest_cache import latest_cache
+from profiling import profiler
+from frame_recorder import FrameRecorder
+from frame_scheduler import DescriptionScheduler, PendingFrame
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -26,43 +31,97 @@ REDIS_FRAME_KEY = "camera_frames:{}"  # Will be formatted with camera_id
 MAX_RETRIES = 3
 RETRY_DELAY = 1  # seconds
 
+def decode_frame(frame_data):
+    data = ast.literal_eval(frame_data.decode('utf-8'))
+    camera_id = data['camera_id']
+    camera_index = data['camera_index']
+    timestamp = datetime.fromisoformat(data['timestamp'])
+    image_data = data['frame']
+    
+    # Decode image data
+    nparr = np.frombuffer(image_data, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError(f"Could not decode image for camera {camera_id}")
+    return camera_id, camera_index, timestamp, image_data, img
+
+def is_assigned(camera_index):
+    return camera_index % MODULUS == INSTANCE_INDEX or (camera_index + ADDITIONAL_INDEX) % MODULUS == INSTANCE_INDEX
+
 class FrameProcessor:
-    def __init__(self):
+    def __init__(self, scheduler=None):
         self.last_processed_time = {camera: 0 for camera in CAMERA_IDS}
         self.image_processor = ImageProcessor()
+        # With a scheduler, changed frames are queued for describe_worker instead of described inline
+        self.scheduler = scheduler
+        self.describing = set()  # Cameras with a description request in flight
 
+    @profiler.track('process_frame')
     async def process_frame(self, frame_data, pool, websocket):
         try:
-            data = ast.literal_eval(frame_data.decode('utf-8'))
-            camera_id = data['camera_id']
-            camera_index = data['camera_index']
-            timestamp = datetime.fromisoformat(data['timestamp'])
-            image_data = data['frame']
-            
-            # Decode image data
-            nparr = np.frombuffer(image_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            decoded = decode_frame(frame_data)
+        except Exception as e:
+            logger.error(f"Error decoding frame: {str(e)}")
+            return
+        await self.process_decoded_frame(*decoded, pool, websocket)
+
+    @profiler.track('process_frames')
+    async def process_frames(self, frames_data, pool, websocket):
+        decoded_frames = []
+        for frame_data in frames_data:
+            try:
+                decoded_frames.append(decode_frame(frame_data))
+            except Exception as e:
+                logger.error(f"Error decoding frame: {str(e)}")
+
+        # Change detection for every camera in a single vectorized pass
+        decisions = self.image_processor.detect_changes({decoded[0]: decoded[4] for decoded in decoded_frames})
+        for decoded in decoded_frames:
+            await self.process_decoded_frame(*decoded, pool, websocket, changed=decisions[decoded[0]])
+
+    async def process_decoded_frame(self, camera_id, camera_index, timestamp, image_data, img, pool, websocket, changed=None):
+        if self.scheduler is not None:
+            await self.schedule_frame(camera_id, camera_index, timestamp, image_data, img, pool, websocket, changed)
+            return
+
+        try:
+            camera_name = camera_names.get(camera_id, 'Unknown')
+
+            async def send_partial(partial_description):
+                await send_to_django(websocket, f"{camera_name} {camera_index} {timestamp} {partial_description}")
 
             description, confidence, was_processed = None, None, False
             retries = 0
 
             while retries < MAX_RETRIES:
-                description, confidence, was_processed = await self.image_processor.process_image_if_changed(camera_id, img)
+                description, confidence, was_processed = await self.image_processor.process_image_if_changed(camera_id, img, send_partial, changed)
+                if changed is not None:
+                    # The change is recorded now; a failed description is retried through pending_descriptions
+                    changed = False
                 
                 if description is not None and confidence is not None:
                     break
+
+                if not vision_breaker.is_available:
+                    # No point retrying against a server that is down
+                    break
                 
                 retries += 1
                 if retries < MAX_RETRIES:
                     logger.warning(f"Retry {retries} for camera {camera_id}")
-                    await asyncio.sleep(RETRY_DELAY)
+                    await asyncio.sleep(jittered_backoff(retries, RETRY_DELAY))
 
             if description is None or confidence is None:
+                if not vision_breaker.is_available:
+                    await update_timestamp(pool, camera_id, timestamp)
+                    logger.info(f"Vision server unavailable, updated timestamp for camera {camera_id} in degraded mode")
+                    self.last_processed_time[camera_id] = time.time()
+                    return
                 logger.error(f"Failed to process image for camera {camera_id} after {MAX_RETRIES} attempts")
                 return
 
-            camera_name = camera_names.get(camera_id, 'Unknown')
-            
+            curtain_check_engine.observe(camera_id, timestamp, description)
+
             if was_processed:
                 await store_results(pool, camera_id, camera_index, timestamp, description, confidence, image_data, camera_name)
                 await send_to_django(websocket, f"{camera_name} {camera_index} {timestamp} {description}")
@@ -78,20 +137,125 @@ class FrameProcessor:
         except Exception as e:
             logger.error(f"Error processing frame for camera {camera_id}: {str(e)}")
 
+    async def schedule_frame(self, camera_id, camera_index, timestamp, image_data, img, pool, websocket, changed=None):
+        try:
+            changed = await self.image_processor.record_change(camera_id, img, changed)
+            # An undescribed earlier change needs a queued frame too, unless it is being described right now
+            undescribed = camera_id in self.image_processor.pending_descriptions and camera_id not in self.describing
+            if changed or undescribed:
+                # Stays pending until described, so the camera's newer frames replace this one in the queue
+                self.image_processor.pending_descriptions.add(camera_id)
+                self.scheduler.push(PendingFrame(camera_id, camera_index, timestamp, image_data, img,
+                                                 self.image_processor.change_magnitudes.get(camera_id, 1.0)))
+                logger.info(f"Queued frame for camera {camera_id}, {len(self.scheduler)} frames waiting")
+                return
+
+            # Unchanged: the last description still holds
+            description, _ = self.image_processor.get_last_processed_info(camera_id)
+            await update_timestamp(pool, camera_id, timestamp)
+            if description is not None:
+                curtain_check_engine.observe(camera_id, timestamp, description)
+                camera_name = camera_names.get(camera_id, 'Unknown')
+                await send_to_django(websocket, f"{camera_name} {camera_index} {timestamp} {description}")
+            logger.info(f"Updated timestamp for camera {camera_id} without processing new image")
+            self.last_processed_time[camera_id] = time.time()
+        except Exception as e:
+            logger.error(f"Error scheduling frame for camera {camera_id}: {str(e)}")
+
+    async def describe_worker(self, pool, websocket):
+        while True:
+            try:
+                frame = await self.scheduler.get()
+                if MOSAIC_MODE and len(self.scheduler) + 1 >= MOSAIC_MIN_FRAMES:
+                    # A backlog, e.g. many cameras changing at once: describe up to MOSAIC_MAX_TILES frames in one call
+                    await self.describe_mosaic([frame] + self.scheduler.pop_many(MOSAIC_MAX_TILES - 1), pool, websocket)
+                else:
+                    await self.describe_frame(frame, pool, websocket)
+            except Exception as e:
+                # One bad frame must not stop the worker
+                logger.error(f"Error in describe worker: {str(e)}")
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def describe_frame(self, frame, pool, websocket):
+        self.describing.add(frame.camera_id)
+        try:
+            camera_name = camera_names.get(frame.camera_id, 'Unknown')
+
+            async def send_partial(partial_description):
+                await send_to_django(websocket, f"{camera_name} {frame.camera_index} {frame.timestamp} {partial_description}")
+
+            description, confidence = await self.image_processor.describe(frame.camera_id, frame.img, send_partial)
+            if description is None or confidence is None:
+                # Still pending in the image processor, the camera's next frame is queued again
+                logger.warning(f"Failed to describe frame for camera {frame.camera_id}")
+                return
+
+            await self.publish_description(frame, description, confidence, pool, websocket)
+        except Exception as e:
+            logger.error(f"Error describing frame for camera {frame.camera_id}: {str(e)}")
+        finally:
+            self.describing.discard(frame.camera_id)
+
+    async def describe_mosaic(self, frames, pool, websocket):
+        camera_ids = {frame.camera_id for frame in frames}
+        self.describing.update(camera_ids)
+        try:
+            results = await self.image_processor.describe_mosaic([(frame.camera_id, frame.img) for frame in frames])
+        except Exception as e:
+            logger.error(f"Error describing mosaic of {len(frames)} frames: {str(e)}")
+            return
+        finally:
+            self.describing.difference_update(camera_ids)
+        logger.info(f"Described {len(results)} of {len(frames)} frames in one mosaic")
+
+        for frame in frames:
+            if frame.camera_id not in results:
+                if vision_breaker.is_available and frame.camera_id not in self.scheduler.pending:
+                    # The model skipped this tile; queue the frame again unless a newer one is already waiting
+                    self.scheduler.push(frame)
+                continue
+            description, confidence = results[frame.camera_id]
+            try:
+                await self.publish_description(frame, description, confidence, pool, websocket)
+            except Exception as e:
+                logger.error(f"Error describing frame for camera {frame.camera_id}: {str(e)}")
+
+    async def publish_description(self, frame, description, confidence, pool, websocket):
+        camera_name = camera_names.get(frame.camera_id, 'Unknown')
+        curtain_check_engine.observe(frame.camera_id, frame.timestamp, description)
+        await store_results(pool, frame.camera_id, frame.camera_index, frame.timestamp, description, confidence, frame.image_data, camera_name)
+        await send_to_django(websocket, f"{camera_name} {frame.camera_index} {frame.timestamp} {description}")
+        self.last_processed_time[frame.camera_id] = time.time()
+        logger.info(f"Processed new frame for camera {frame.camera_id}")
 
 async def main():
-    redis_client = await connect_redis()
-    redis = await aioredis.create_redis_pool(f'redis://{REDIS_HOST}:{REDIS_PORT}')
-    db_conn = await connect_database()
-    pool = await asyncpg.create_pool(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD)
-    websocket = await connect_websocket()
+    # All backends connect concurrently; every module shares these clients
+    await resources.connect()
+    redis = resources.redis
+    db_conn = resources.db_conn
+    pool = resources.pool
+    websocket = resources.websocket
+
+    if LLM_CACHE_USE_REDIS:
+        llm_cache.attach_redis(redis)
+    if LATEST_CACHE_USE_REDIS:
+        latest_cache.attach_redis(redis)
+
+    profiler.install_signal_handler()
 
-    frame_processor = FrameProcessor()
+    frame_processor = FrameProcessor(DescriptionScheduler() if PRIORITY_SCHEDULING else None)
+    workers = []
+    if PRIORITY_SCHEDULING:
+        workers = [asyncio.ensure_future(frame_processor.describe_worker(pool, websocket))
+                   for _ in range(DESCRIPTION_WORKERS)]
+    recorder = FrameRecorder(RECORD_DIR) if RECORD_DIR else None
     
     camera_index = INSTANCE_INDEX
+    assigned_cameras = [camera_id for index, camera_id in enumerate(CAMERA_IDS) if is_assigned(index)]
     camera_count = 0
     state_processing_interval = 60
     last_state_processing = 0
+    last_batch = None
     
     # Schedule the checks
     if PROCESS_STATE:
@@ -100,31 +264,53 @@ async def main():
     try:
         while True:
             try:
-                camera_id = CAMERA_IDS[camera_index]
-                frame_data = await redis.get(REDIS_FRAME_KEY.format(camera_id))
-                
-                if frame_data and (camera_index % MODULUS == INSTANCE_INDEX or (camera_index + ADDITIONAL_INDEX) % MODULUS == INSTANCE_INDEX):
-                    await frame_processor.process_frame(frame_data, pool, websocket)
-                
-                camera_index = (camera_index + 1) % len(CAMERA_IDS)
-                
-                camera_count += 1
+                if BATCH_DETECTION:
+                    # Every assigned camera in one pass: one MGET and one vectorized change detection.
+                    # Passes are BATCH_INTERVAL apart, in between the loop only serves requests.
+                    if last_batch is None or time.monotonic() - last_batch >= BATCH_INTERVAL:
+                        last_batch = time.monotonic()
+                        frames_data = await redis.mget(*(REDIS_FRAME_KEY.format(camera_id) for camera_id in assigned_cameras))
+                        frames_data = [(camera_id, frame_data) for camera_id, frame_data in zip(assigned_cameras, frames_data) if frame_data]
+                        if recorder:
+                            for camera_id, frame_data in frames_data:
+                                recorder.record(camera_id, frame_data)
+                        await frame_processor.process_frames([frame_data for _, frame_data in frames_data], pool, websocket)
+                        camera_count += len(CAMERA_IDS)
+                else:
+                    camera_id = CAMERA_IDS[camera_index]
+                    frame_data = await redis.get(REDIS_FRAME_KEY.format(camera_id))
+                    
+                    if frame_data and is_assigned(camera_index):
+                        if recorder:
+                            recorder.record(camera_id, frame_data)
+                        await frame_processor.process_frame(frame_data, pool, websocket)
+                    
+                    camera_index = (camera_index + 1) % len(CAMERA_IDS)
+                    
+                    camera_count += 1
                 if PROCESS_STATE:
                     if camera_count >= len(camera_names):
-                        await process_state(db_conn, redis_client)
+                        await process_state(db_conn, redis)
                         camera_count = 0
-                state_request = await redis.blpop(REDIS_STATE_CHANNEL, timeout=1)
-                if state_request:
-                    await process_state(pool, redis)
+                request = await redis.blpop(REDIS_STATE_CHANNEL, REDIS_PROFILE_CHANNEL, timeout=1)
+                if request:
+                    channel, payload = request
+                    if channel.decode('utf-8') == REDIS_PROFILE_CHANNEL:
+                        profiler.handle_request(payload.decode('utf-8'))
+                    else:
+                        await process_state(db_conn, redis)
                 
                 await asyncio.sleep(0.1)  # Prevent CPU overuse
             except Exception as e:
                 logger.error(f"Error in main loop: {str(e)}")
                 await asyncio.sleep(1)
     finally:
-        redis.close()
-        await redis.wait_closed()
-        await pool.close()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if recorder:
+            recorder.close()
+        await resources.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,142 +1,296 @@
 import asyncio
+import hashlib
 import logging
 import psycopg2
 from psycopg2 import sql
-from config import DB_HOST, DB_NAME, DB_USER, DB_PASSWORD
-from datetime import datetime, time
+import asyncpg
+from config import DB_HOST, DB_NAME, DB_USER, DB_PASSWORD, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, MODULUS, STORE_INLINE_DESCRIPTIONS
+from latest_cache import latest_cache
+from datetime import datetime, time, timedelta
 
 logger = logging.getLogger(__name__)
 
+# Description text for a metadata row; older rows only have the inline column
+DESCRIPTION_JOIN = "LEFT JOIN visionmon_descriptions vd ON vd.id = vm.description_id"
+DESCRIPTION_TEXT = "COALESCE(vd.text, vm.description)"
+# Each distinct description once, with its number of occurrences when it repeated
+COUNTED_TEXT = "text || CASE WHEN occurrences > 1 THEN ' (x' || occurrences || ')' ELSE '' END"
+
+def setup_database():
+    # Blocking connect and schema setup, run in an executor by connect_database
+    conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD)
+    cur = conn.cursor()
+    
+    # Create tables and indexes
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS visionmon_binary_data (
+            id SERIAL PRIMARY KEY,
+            data BYTEA NOT NULL
+        )
+    """)
+    
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS visionmon_metadata (
+            id SERIAL PRIMARY KEY,
+            data_id INTEGER NOT NULL,
+            camera_id VARCHAR(255),
+            camera_index INTEGER,
+            timestamp TIMESTAMP,
+            description TEXT,
+            confidence FLOAT,
+            camera_name VARCHAR(255)
+        )
+    """)
+    
+    cur.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM information_schema.table_constraints 
+                WHERE constraint_name = 'fk_binary_data' AND table_name = 'visionmon_metadata'
+            ) THEN
+                ALTER TABLE visionmon_metadata
+                ADD CONSTRAINT fk_binary_data
+                FOREIGN KEY (data_id)
+                REFERENCES visionmon_binary_data (id)
+                ON DELETE CASCADE;
+            END IF;
+        END $$;
+    """)
+    
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_metadata_data_id ON visionmon_metadata(data_id);
+    """)
+
+    # Frames referenced by an alert survive the run collapsing in store_results
+    cur.execute("""
+        ALTER TABLE visionmon_binary_data
+        ADD COLUMN IF NOT EXISTS pinned BOOLEAN NOT NULL DEFAULT FALSE
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS visionmon_descriptions (
+            id SERIAL PRIMARY KEY,
+            hash CHAR(64) UNIQUE NOT NULL,
+            text TEXT NOT NULL
+        )
+    """)
+
+    # Metadata rows reference the description dictionary and collapse consecutive repeats into one row
+    cur.execute("""
+        ALTER TABLE visionmon_metadata
+        ADD COLUMN IF NOT EXISTS description_id INTEGER REFERENCES visionmon_descriptions (id),
+        ADD COLUMN IF NOT EXISTS repeat_count INTEGER NOT NULL DEFAULT 1,
+        ADD COLUMN IF NOT EXISTS first_timestamp TIMESTAMP
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_metadata_camera_timestamp ON visionmon_metadata(camera_id, timestamp);
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS visionmon_state_labels (
+            id SERIAL PRIMARY KEY,
+            camera_id VARCHAR(255),
+            timestamp TIMESTAMP DEFAULT NOW(),
+            description TEXT,
+            state VARCHAR(255)
+        )
+    """)
+    
+    conn.commit()
+    
+    return conn
+
 async def connect_database():
     while True:
         try:
-            conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD)
-            cur = conn.cursor()
-            
-            # Create tables and indexes
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS visionmon_binary_data (
-                    id SERIAL PRIMARY KEY,
-                    data BYTEA NOT NULL
-                )
-            """)
-            
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS visionmon_metadata (
-                    id SERIAL PRIMARY KEY,
-                    data_id INTEGER NOT NULL,
-                    camera_id VARCHAR(255),
-                    camera_index INTEGER,
-                    timestamp TIMESTAMP,
-                    description TEXT,
-                    confidence FLOAT,
-                    camera_name VARCHAR(255)
-                )
-            """)
-            
-            cur.execute("""
-                DO $$
-                BEGIN
-                    IF NOT EXISTS (
-                        SELECT 1 FROM information_schema.table_constraints 
-                        WHERE constraint_name = 'fk_binary_data' AND table_name = 'visionmon_metadata'
-                    ) THEN
-                        ALTER TABLE visionmon_metadata
-                        ADD CONSTRAINT fk_binary_data
-                        FOREIGN KEY (data_id)
-                        REFERENCES visionmon_binary_data (id)
-                        ON DELETE CASCADE;
-                    END IF;
-                END $$;
-            """)
-            
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_metadata_data_id ON visionmon_metadata(data_id);
-            """)
-            
-            conn.commit()
-            
+            conn = await asyncio.get_running_loop().run_in_executor(None, setup_database)
             logger.info("Connected to PostgreSQL database and ensured schema is up to date")
             return conn
         except psycopg2.Error as e:
             logger.error(f"Failed to connect to PostgreSQL or set up schema: {str(e)}")
             await asyncio.sleep(5)
 
-import asyncpg
+async def connect_pool():
+    while True:
+        try:
+            # min_size connections are opened up front so the pool is warm
+            pool = await asyncpg.create_pool(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD,
+                                             min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE)
+            logger.info(f"Connected asyncpg pool with {pool.get_size()} warm connections")
+            return pool
+        except Exception as e:
+            logger.error(f"Failed to create asyncpg pool: {str(e)}")
+            await asyncio.sleep(5)
 
 async def store_results(pool, camera_id, camera_index, timestamp, description, confidence, image_data, camera_name):
+    description_hash = hashlib.sha256(description.encode('utf-8')).hexdigest()
     async with pool.acquire() as conn:
         async with conn.transaction():
+            # DO UPDATE (instead of DO NOTHING) so RETURNING yields the id of an existing entry too
+            description_id = await conn.fetchval("""
+                INSERT INTO visionmon_descriptions (hash, text) VALUES ($1, $2)
+                ON CONFLICT (hash) DO UPDATE SET hash = EXCLUDED.hash
+                RETURNING id
+            """, description_hash, description)
+
             binary_data_id = await conn.fetchval(
                 "INSERT INTO visionmon_binary_data (data) VALUES ($1) RETURNING id",
                 image_data
             )
+
+            previous = await conn.fetchrow("""
+                SELECT id, data_id, description_id
+                FROM visionmon_metadata
+                WHERE camera_id = $1
+                ORDER BY timestamp DESC
+                LIMIT 1
+                FOR UPDATE
+            """, camera_id)
             
-            await conn.execute("""
-                INSERT INTO visionmon_metadata 
-                (data_id, camera_id, camera_index, timestamp, description, confidence, camera_name) 
-                VALUES ($1, $2, $3, $4, $5, $6, $7)
-            """, binary_data_id, camera_id, camera_index, timestamp, description, confidence, camera_name)
+            if previous and previous['description_id'] == description_id:
+                # Same description as the camera's last row: extend that run instead of adding a row
+                await conn.execute("""
+                    UPDATE visionmon_metadata
+                    SET repeat_count = repeat_count + 1,
+                        first_timestamp = COALESCE(first_timestamp, timestamp),
+                        timestamp = $2, data_id = $3, confidence = $4
+                    WHERE id = $1
+                """, previous['id'], timestamp, binary_data_id, confidence)
+                await conn.execute("DELETE FROM visionmon_binary_data WHERE id = $1 AND NOT pinned", previous['data_id'])
+            else:
+                await conn.execute("""
+                    INSERT INTO visionmon_metadata 
+                    (data_id, camera_id, camera_index, timestamp, first_timestamp, description, description_id, confidence, camera_name) 
+                    VALUES ($1, $2, $3, $4, $4, $5, $6, $7, $8)
+                """, binary_data_id, camera_id, camera_index, timestamp,
+                    description if STORE_INLINE_DESCRIPTIONS else None, description_id, confidence, camera_name)
     
+    await latest_cache.record_result(camera_id, timestamp, description, binary_data_id, image_data)
     logger.info(f"Stored results and image for camera {camera_index}")
+    return binary_data_id
+
+def latest_cache_is_authoritative():
+    # A single instance writes every camera, so nothing changes the database behind the cache's back
+    return MODULUS == 1
+
+def latest_cache_is_complete():
+    # With several instances only the Redis mirror sees the other instances' writes
+    return latest_cache.loaded_from_db and (latest_cache.redis_client is not None or latest_cache_is_authoritative())
 
 async def fetch_latest_descriptions(conn):
+    # Served from the write-path cache; the database is only read once to fill it on a cold start.
+    if latest_cache_is_complete():
+        return await latest_cache.latest_descriptions()
+
     cur = conn.cursor()
-    cur.execute("""
-        SELECT camera_id, description
-        FROM visionmon_metadata
-        WHERE (camera_id, timestamp) IN (
+    cur.execute(f"""
+        SELECT vm.camera_id, {DESCRIPTION_TEXT}
+        FROM visionmon_metadata vm
+        {DESCRIPTION_JOIN}
+        WHERE (vm.camera_id, vm.timestamp) IN (
             SELECT camera_id, MAX(timestamp)
             FROM visionmon_metadata
             GROUP BY camera_id
         )
     """)
-    return dict(cur.fetchall())
+    rows = dict(cur.fetchall())
+    if not latest_cache_is_authoritative() and latest_cache.redis_client is None:
+        # Other instances' writes only show up in the database, so it stays the source on every call
+        return rows
+    for camera_id, description in rows.items():
+        latest_cache.load(camera_id, description=description)
+    latest_cache.loaded_from_db = True
+    return await latest_cache.latest_descriptions()
 
 async def fetch_hourly_aggregated_descriptions(conn):
     cur = conn.cursor()
-    cur.execute("""
-        SELECT camera_id, STRING_AGG(description, ' ') as descriptions
-        FROM visionmon_metadata
-        WHERE timestamp >= NOW() - INTERVAL '1 hour'
+    cur.execute(f"""
+        SELECT camera_id, STRING_AGG({COUNTED_TEXT}, ' ' ORDER BY last_seen) as descriptions
+        FROM (
+            SELECT vm.camera_id, {DESCRIPTION_TEXT} AS text, SUM(vm.repeat_count) AS occurrences, MAX(vm.timestamp) AS last_seen
+            FROM visionmon_metadata vm
+            {DESCRIPTION_JOIN}
+            WHERE vm.timestamp >= NOW() - INTERVAL '1 hour'
+            GROUP BY vm.camera_id, {DESCRIPTION_TEXT}
+        ) distinct_descriptions
         GROUP BY camera_id
     """)
     return dict(cur.fetchall())
 
 async def fetch_aggregated_descriptions(conn):
+    # The rows at each camera's latest timestamp, which is what the write-path cache holds
+    if latest_cache_is_complete():
+        return await latest_cache.latest_descriptions()
+
     cur = conn.cursor()
-    cur.execute("""
-        SELECT camera_id, STRING_AGG(description, ' ') as descriptions
-        FROM visionmon_metadata
-        WHERE (camera_id, timestamp) IN (
+    cur.execute(f"""
+        SELECT vm.camera_id, STRING_AGG({DESCRIPTION_TEXT}, ' ') as descriptions
+        FROM visionmon_metadata vm
+        {DESCRIPTION_JOIN}
+        WHERE (vm.camera_id, vm.timestamp) IN (
             SELECT camera_id, MAX(timestamp)
             FROM visionmon_metadata
             GROUP BY camera_id
         )
-        GROUP BY camera_id
+        GROUP BY vm.camera_id
     """)
     return dict(cur.fetchall())
 
 async def fetch_descriptions_for_timerange(conn, camera_id, start_time, end_time):
     cur = conn.cursor()
     
-    # Convert time objects to strings in HH:MM format
-    start_time_str = start_time.strftime('%H:%M')
-    end_time_str = end_time.strftime('%H:%M')
+    # Today's window as full timestamps; end_time is inclusive, so the window runs to the end of that minute
+    today = datetime.now().date()
+    window_start = datetime.combine(today, start_time)
+    window_end = datetime.combine(today, end_time) + timedelta(minutes=1)
     
-    cur.execute("""
-        SELECT STRING_AGG(description, ' ') as descriptions
-        FROM visionmon_metadata
-        WHERE camera_id = %s
-        AND (CAST(timestamp AS TIME) BETWEEN %s AND %s)
-        AND timestamp::date = CURRENT_DATE
-    """, (camera_id, start_time_str, end_time_str))
+    # A collapsed run matches when any part of it overlaps the window, even if it began on an earlier day
+    cur.execute(f"""
+        SELECT STRING_AGG({COUNTED_TEXT}, ' ' ORDER BY last_seen) as descriptions
+        FROM (
+            SELECT {DESCRIPTION_TEXT} AS text, SUM(vm.repeat_count) AS occurrences, MAX(vm.timestamp) AS last_seen
+            FROM visionmon_metadata vm
+            {DESCRIPTION_JOIN}
+            WHERE vm.camera_id = %s
+            AND COALESCE(vm.first_timestamp, vm.timestamp) < %s
+            AND vm.timestamp >= %s
+            GROUP BY {DESCRIPTION_TEXT}
+        ) distinct_descriptions
+    """, (camera_id, window_end, window_start))
     
     result = cur.fetchone()
     return result[0] if result else None
 
+async def store_state_labels(conn, labels):
+    # labels: list of (camera_id, description, state) decided by the LLM
+    if not labels:
+        return
+    cur = conn.cursor()
+    cur.executemany("""
+        INSERT INTO visionmon_state_labels (camera_id, description, state)
+        VALUES (%s, %s, %s)
+    """, labels)
+    conn.commit()
+
+async def fetch_state_labels(conn, limit):
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT camera_id, description, state
+        FROM visionmon_state_labels
+        ORDER BY timestamp DESC
+        LIMIT %s
+    """, (limit,))
+    return cur.fetchall()
+
 # You may want to add a function to get the latest frame for a specific camera
 async def get_latest_frame(conn, camera_id):
+    # Other instances' frames are not in the cache, only the database has them
+    frame = latest_cache.get(camera_id, 'frame') if latest_cache_is_authoritative() else None
+    if frame is not None:
+        return frame
+
     cur = conn.cursor()
     cur.execute("""
         SELECT vb.data
@@ -147,8 +301,33 @@ async def get_latest_frame(conn, camera_id):
         LIMIT 1
     """, (camera_id,))
     result = cur.fetchone()
+    if result and latest_cache_is_authoritative():
+        latest_cache.load(camera_id, frame=result[0])
     return result[0] if result else None
 
+async def pin_latest_frame(conn, camera_id, attempts=3):
+    # Marks the camera's latest frame as referenced (e.g. by an alert) and returns its id.
+    # A concurrent store_results may replace and delete that frame first; then the new latest frame is pinned.
+    cur = conn.cursor()
+    for _ in range(attempts):
+        cur.execute("""
+            UPDATE visionmon_binary_data
+            SET pinned = TRUE
+            WHERE id = (
+                SELECT data_id
+                FROM visionmon_metadata
+                WHERE camera_id = %s
+                ORDER BY timestamp DESC
+                LIMIT 1
+            )
+            RETURNING id
+        """, (camera_id,))
+        result = cur.fetchone()
+        conn.commit()
+        if result:
+            return result[0]
+    return None
+
 async def update_timestamp(pool, camera_id, timestamp):
     async with pool.acquire() as conn:
         await conn.execute("""
@@ -159,4 +338,5 @@ async def update_timestamp(pool, camera_id, timestamp):
                 FROM visionmon_metadata
                 WHERE camera_id = $1
             )
-        """, camera_id, timestamp)
\ No newline at end of file
+        """, camera_id, timestamp)
+    await latest_cache.record_timestamp(camera_id, timestamp)
\ No newline at end of file
@@ -0,0 +1,116 @@
+import json
+import logging
+from datetime import datetime
+from config import FACILITY_SNAPSHOT_KEY, camera_names, camera_indexes
+
+logger = logging.getLogger(__name__)
+
+# Fields of the FACILITY_SNAPSHOT_KEY hash
+CAMERA_FIELD = 'camera:'  # + camera_id -> JSON description, timestamp and data_id, written by latest_cache
+STATE_FIELD = 'state:'  # + camera_id -> camera state
+FACILITY_STATE_FIELD = 'facility_state'
+UPDATED_AT_FIELD = 'updated_at'
+VERSION_FIELD = 'version'  # incremented whenever a description or state changes
+
+
+def is_error_state(state):
+    # process_camera_state / process_facility_state report failures as text
+    return state is None or state.startswith("Error processing")
+
+
+def display_camera_states(camera_states):
+    # camera_id -> state, keyed by camera name and index as published to Django
+    return {f"{camera_names[camera_id]} {camera_indexes[camera_id]}": state for camera_id, state in camera_states.items()}
+
+
+def changed_fields(fields, written):
+    # The fields whose value differs from what was last written
+    return {field: value for field, value in fields.items() if written.get(field) != value}
+
+
+async def write_snapshot_fields(redis_client, fields, bump_version=True):
+    # Fields and version bump in one transaction, so readers never see new values under an old version
+    if not bump_version:
+        await redis_client.hmset_dict(FACILITY_SNAPSHOT_KEY, fields)
+        return None
+    transaction = redis_client.multi_exec()
+    transaction.hmset_dict(FACILITY_SNAPSHOT_KEY, fields)
+    transaction.hincrby(FACILITY_SNAPSHOT_KEY, VERSION_FIELD, 1)
+    results = await transaction.execute()
+    return results[-1]
+
+
+async def read_facility_snapshot(redis_client):
+    # The whole current picture in one round-trip
+    snapshot = {'version': 0, 'facility_state': None, 'updated_at': None, 'cameras': {}}
+    fields = await redis_client.hgetall(FACILITY_SNAPSHOT_KEY)
+    for field, value in fields.items():
+        field, value = field.decode('utf-8'), value.decode('utf-8')
+        if field == VERSION_FIELD:
+            snapshot['version'] = int(value)
+        elif field == FACILITY_STATE_FIELD:
+            snapshot['facility_state'] = value
+        elif field == UPDATED_AT_FIELD:
+            snapshot['updated_at'] = value
+        elif field.startswith(CAMERA_FIELD):
+            snapshot['cameras'].setdefault(field[len(CAMERA_FIELD):], {}).update(json.loads(value))
+        elif field.startswith(STATE_FIELD):
+            snapshot['cameras'].setdefault(field[len(STATE_FIELD):], {})['state'] = value
+    return snapshot
+
+
+class FacilitySnapshot:
+    # What the last state pass computed and from which inputs, so the next pass only recomputes what changed
+    def __init__(self):
+        self.camera_inputs = {}  # camera_id -> (description, quiet, night-time) its state was computed from
+        self.camera_states = {}
+        self.facility_input = None
+        self.facility_state = None
+        self.version = None
+        self.written = {}  # field -> value this process last wrote to the hash
+
+    @staticmethod
+    def camera_input(camera_id, description, schedule):
+        return description, schedule.is_quiet(camera_id), schedule.is_night_time
+
+    def changed_cameras(self, descriptions, schedule):
+        return {camera_id: description for camera_id, description in descriptions.items()
+                if self.camera_inputs.get(camera_id) != self.camera_input(camera_id, description, schedule)}
+
+    def update_cameras(self, descriptions, schedule, camera_states):
+        for camera_id, state in camera_states.items():
+            self.camera_states[camera_id] = state
+            if is_error_state(state):
+                # Try again next pass
+                self.camera_inputs.pop(camera_id, None)
+            else:
+                self.camera_inputs[camera_id] = self.camera_input(camera_id, descriptions[camera_id], schedule)
+
+    def facility_changed(self, facility_input):
+        return facility_input != self.facility_input
+
+    def update_facility(self, facility_input, facility_state):
+        self.facility_state = facility_state
+        self.facility_input = None if is_error_state(facility_state) else facility_input
+
+    async def publish(self, redis_client, camera_states, facility_changed, camera_records=None):
+        # Writes what changed in this pass; camera_records carries description fields when no mirror writes them
+        fields = {STATE_FIELD + camera_id: state for camera_id, state in camera_states.items()}
+        for camera_id, record in (camera_records or {}).items():
+            fields[CAMERA_FIELD + camera_id] = json.dumps(record)
+        if facility_changed:
+            fields[FACILITY_STATE_FIELD] = self.facility_state
+        # A recomputed state that came out the same is not a new version
+        fields = changed_fields(fields, self.written)
+        if not fields:
+            return self.version
+        fields[UPDATED_AT_FIELD] = datetime.now().isoformat()
+        try:
+            self.version = await write_snapshot_fields(redis_client, fields)
+            self.written.update(fields)
+        except Exception as e:
+            logger.error(f"Error writing facility snapshot: {str(e)}")
+        return self.version
+
+
+facility_snapshot = FacilitySnapshot()
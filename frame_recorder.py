@@ -0,0 +1,86 @@
+import logging
+import mmap
+import os
+import struct
+import time
+from config import RECORD_DIR
+
+logger = logging.getLogger(__name__)
+
+# Each record: magic, payload length, recorded-at wall time, then the raw Redis frame value
+RECORD_HEADER = struct.Struct('<4sId')
+RECORD_MAGIC = b'FRM1'
+SEGMENT_SUFFIX = '.seg'
+
+
+def segment_path(record_dir, camera_id, recorded_at):
+    return os.path.join(record_dir, camera_id, time.strftime('%Y%m%d', time.localtime(recorded_at)) + SEGMENT_SUFFIX)
+
+
+class FrameRecorder:
+    def __init__(self, record_dir=RECORD_DIR):
+        self.record_dir = record_dir
+        self.files = {}  # camera_id -> (path, open file)
+        self.last_frames = {}
+
+    def record(self, camera_id, frame_data, recorded_at=None):
+        # The Redis key is polled, so the same frame is usually read several times in a row
+        if self.last_frames.get(camera_id) == frame_data:
+            return False
+        self.last_frames[camera_id] = frame_data
+
+        if recorded_at is None:
+            recorded_at = time.time()
+        path = segment_path(self.record_dir, camera_id, recorded_at)
+        f = self.segment_file(camera_id, path)
+        f.write(RECORD_HEADER.pack(RECORD_MAGIC, len(frame_data), recorded_at))
+        f.write(frame_data)
+        f.flush()
+        return True
+
+    def segment_file(self, camera_id, path):
+        current = self.files.get(camera_id)
+        if current is not None and current[0] == path:
+            return current[1]
+        if current is not None:
+            current[1].close()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open(path, 'ab')
+        self.files[camera_id] = (path, f)
+        logger.info(f"Recording frames for camera {camera_id} to {path}")
+        return f
+
+    def close(self):
+        for _, f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+def read_segment(path):
+    # Yields (recorded_at, payload); payload is a zero-copy view into the mapped file, valid until the next record
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            offset = 0
+            try:
+                while offset + RECORD_HEADER.size <= len(view):
+                    magic, length, recorded_at = RECORD_HEADER.unpack_from(view, offset)
+                    start = offset + RECORD_HEADER.size
+                    if magic != RECORD_MAGIC or start + length > len(view):
+                        # Torn write at the end of a segment that was still being recorded
+                        logger.warning(f"Stopping at incomplete record in {path} at offset {offset}")
+                        break
+                    payload = view[start:start + length]
+                    try:
+                        yield recorded_at, payload
+                    finally:
+                        payload.release()
+                    offset = start + length
+            finally:
+                view.release()
+
+
+def camera_id_for_segment(path):
+    return os.path.basename(os.path.dirname(os.path.abspath(path)))
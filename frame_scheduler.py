@@ -0,0 +1,96 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from config import FRAME_DEADLINE, FRAME_AGE_HALF_LIFE, CAMERA_IMPORTANCE
+
+logger = logging.getLogger(__name__)
+
+MIN_CHANGE_MAGNITUDE = 1e-3
+
+
+class PendingFrame:
+    def __init__(self, camera_id, camera_index, timestamp, image_data, img, change_magnitude):
+        self.camera_id = camera_id
+        self.camera_index = camera_index
+        self.timestamp = timestamp
+        self.image_data = image_data
+        self.img = img
+        self.change_magnitude = change_magnitude
+        self.enqueued_at = time.monotonic()
+        self.seq = None
+
+
+class DescriptionScheduler:
+    def __init__(self, deadline=FRAME_DEADLINE, half_life=FRAME_AGE_HALF_LIFE, importance=CAMERA_IMPORTANCE):
+        self.deadline = deadline
+        # Priority halves every half_life seconds of waiting
+        self.decay = math.log(2) / half_life
+        self.importance = importance
+        self.heap = []
+        self.pending = {}  # camera_id -> newest PendingFrame
+        self.counter = itertools.count()
+        self.available = asyncio.Event()
+        self.superseded = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def priority_key(self, frame):
+        # log(magnitude * importance) - decay * age; the "- decay * now" part is shared by every entry,
+        # so ordering on log(magnitude * importance) + decay * enqueued_at is the same and never changes
+        weight = max(frame.change_magnitude, MIN_CHANGE_MAGNITUDE) * self.importance.get(frame.camera_id, 1.0)
+        return math.log(weight) + self.decay * frame.enqueued_at
+
+    def push(self, frame):
+        previous = self.pending.get(frame.camera_id)
+        if previous is not None:
+            # Only the newest frame per camera is worth describing, but it keeps the size of the change it replaces
+            # and how long the camera has been waiting, so re-polling a camera doesn't reset its age or deadline
+            self.superseded += 1
+            frame.change_magnitude = max(frame.change_magnitude, previous.change_magnitude)
+            frame.enqueued_at = min(frame.enqueued_at, previous.enqueued_at)
+        frame.seq = next(self.counter)
+        self.pending[frame.camera_id] = frame
+        heapq.heappush(self.heap, (-self.priority_key(frame), frame.seq, frame.camera_id))
+        if len(self.heap) > 4 * len(self.pending) + 32:
+            # Drop entries left behind by superseded frames
+            self.heap = [entry for entry in self.heap
+                         if entry[2] in self.pending and self.pending[entry[2]].seq == entry[1]]
+            heapq.heapify(self.heap)
+        self.available.set()
+
+    def pop(self):
+        now = time.monotonic()
+        while self.heap:
+            _, seq, camera_id = heapq.heappop(self.heap)
+            frame = self.pending.get(camera_id)
+            if frame is None or frame.seq != seq:
+                continue  # superseded by a newer frame for this camera
+            del self.pending[camera_id]
+            if now - frame.enqueued_at > self.deadline:
+                self.expired += 1
+                logger.info(f"Dropping frame for camera {camera_id}, waited {now - frame.enqueued_at:.1f}s")
+                continue
+            return frame
+        self.available.clear()
+        return None
+
+    def pop_many(self, limit):
+        frames = []
+        while len(frames) < limit:
+            frame = self.pop()
+            if frame is None:
+                break
+            frames.append(frame)
+        return frames
+
+    async def get(self):
+        while True:
+            frame = self.pop()
+            if frame is not None:
+                return frame
+            await self.available.wait()
@@ -1,12 +1,109 @@
 import cv2
 import numpy as np
 from skimage.metrics import structural_similarity as ssim
-from openai_operations import process_image
+from openai_operations import process_image, process_mosaic, vision_breaker
+from mosaic import build_mosaic, parse_mosaic_description
 import logging
 import base64
+from profiling import profiler
+from config import (BATCH_DETECTION_SIZE, BATCH_SSIM_THRESHOLD, CROP_TO_MOTION, MOTION_DIFF_THRESHOLD,
+                    MOTION_MIN_AREA, MOTION_MAX_BOXES, MOTION_PADDING, MOTION_MAX_CROP_FRACTION,
+                    MOTION_THUMBNAIL_WIDTH)
 
 logger = logging.getLogger(__name__)
 
+SSIM_WINDOW = 7
+SSIM_K1, SSIM_K2 = 0.01, 0.03
+MOTION_KERNEL = np.ones((5, 5), np.uint8)
+
+def box_mean(stack, window):
+    # Mean over every window x window patch of each image in an (N, H, W) stack, via integral images
+    integral = np.zeros((stack.shape[0], stack.shape[1] + 1, stack.shape[2] + 1))
+    np.cumsum(np.cumsum(stack, axis=1), axis=2, out=integral[:, 1:, 1:])
+    sums = (integral[:, window:, window:] - integral[:, :-window, window:]
+            - integral[:, window:, :-window] + integral[:, :-window, :-window])
+    return sums / (window * window)
+
+def batch_ssim(x, y, window=SSIM_WINDOW, data_range=255.0):
+    # Mean SSIM per image pair for (N, H, W) stacks, matching skimage's structural_similarity defaults
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    cov_norm = window * window / (window * window - 1)
+    ux, uy = box_mean(x, window), box_mean(y, window)
+    uxx, uyy, uxy = box_mean(x * x, window), box_mean(y * y, window), box_mean(x * y, window)
+    vx = cov_norm * (uxx - ux * ux)
+    vy = cov_norm * (uyy - uy * uy)
+    vxy = cov_norm * (uxy - ux * uy)
+    c1 = (SSIM_K1 * data_range) ** 2
+    c2 = (SSIM_K2 * data_range) ** 2
+    ssim_map = ((2 * ux * uy + c1) * (2 * vxy + c2)) / ((ux * ux + uy * uy + c1) * (vx + vy + c2))
+    return ssim_map.mean(axis=(1, 2))
+
+class BatchChangeDetector:
+    def __init__(self, size=BATCH_DETECTION_SIZE, ssim_threshold=BATCH_SSIM_THRESHOLD):
+        self.size = size  # (width, height) every frame is downscaled to
+        self.ssim_threshold = ssim_threshold
+        self.prev_frames = {}
+
+    def downscale(self, img):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA)
+
+    def scores(self, frames):
+        # Returns camera_id -> SSIM against that camera's previous frame, None for cameras seen for the first time
+        current = {camera_id: self.downscale(img) for camera_id, img in frames.items()}
+        known = [camera_id for camera_id in current if camera_id in self.prev_frames]
+        scores = {camera_id: None for camera_id in current}
+        if known:
+            values = batch_ssim(np.stack([self.prev_frames[camera_id] for camera_id in known]),
+                                np.stack([current[camera_id] for camera_id in known]))
+            scores.update(zip(known, values.tolist()))
+        self.prev_frames.update(current)
+        return scores
+
+def find_motion_boxes(frame_diff, diff_threshold=MOTION_DIFF_THRESHOLD, min_area=MOTION_MIN_AREA, padding=MOTION_PADDING):
+    # Padded (x0, y0, x1, y1) boxes around the regions of an absdiff image that changed
+    _, mask = cv2.threshold(frame_diff, diff_threshold, 255, cv2.THRESH_BINARY)
+    # Join nearby changed pixels, e.g. the limbs of one person, into one region
+    mask = cv2.dilate(mask, MOTION_KERNEL, iterations=2)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    height, width = frame_diff.shape[:2]
+    boxes = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w * h < min_area:
+            continue
+        boxes.append((max(x - padding, 0), max(y - padding, 0), min(x + w + padding, width), min(y + h + padding, height)))
+    return boxes
+
+def union_box(boxes):
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+def merge_boxes(boxes, max_boxes=MOTION_MAX_BOXES):
+    # Merge overlapping boxes until none overlap; too many regions become a single crop
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = union_box([a, b])
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    if len(boxes) > max_boxes:
+        return [union_box(boxes)]
+    return boxes
+
+def encode_png(img):
+    _, buffer = cv2.imencode('.png', img)
+    return base64.b64encode(buffer).decode('utf-8')
+
 class ImageProcessor:
     def __init__(self):
         self.prev_frames = {}
@@ -14,26 +111,46 @@ class ImageProcessor:
         self.change_accumulators = {}
         self.last_processed_images = {}
         self.last_processed_info = {}  # Store last processed description and confidence
+        self.pending_descriptions = set()  # Changed cameras still waiting for a description
+        self.change_magnitudes = {}  # 1 - SSIM of each camera's latest comparison
         self.ssim_threshold = 0.95  # Adjust this threshold as needed
+        self.batch_detector = BatchChangeDetector()
+        self.crop_to_motion = CROP_TO_MOTION
+        self.motion_boxes = {}  # Changed regions not yet covered by a description
 
+    @profiler.track('should_process_image')
     async def should_process_image(self, camera_id, img):
         if camera_id not in self.prev_frames:
-            self.prev_frames[camera_id] = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            self.change_magnitudes[camera_id] = 1.0
+            return self.record_frame(camera_id, img, True)
+
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        ssim_value = ssim(self.prev_frames[camera_id], gray)
+        self.change_magnitudes[camera_id] = 1.0 - ssim_value
+        return self.record_frame(camera_id, img, ssim_value < self.ssim_threshold, gray)
+
+    def record_frame(self, camera_id, img, changed, gray=None):
+        # Bookkeeping for a change decision, whether it came from should_process_image or detect_changes
+        if gray is None:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+        if camera_id not in self.prev_frames:
+            self.prev_frames[camera_id] = gray
             self.base_frames[camera_id] = img.copy().astype(float)
             self.change_accumulators[camera_id] = np.zeros(img.shape[:2], dtype=np.float32)
             self.last_processed_images[camera_id] = img
             return True
 
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        ssim_value = ssim(self.prev_frames[camera_id], gray)
-
-        if ssim_value < self.ssim_threshold:
+        if changed:
             cv2.accumulateWeighted(img, self.base_frames[camera_id], 0.1)
 
             frame_diff = cv2.absdiff(gray, self.prev_frames[camera_id])
             thresh = cv2.adaptiveThreshold(frame_diff, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
                                            cv2.THRESH_BINARY, 11, 2)
             self.change_accumulators[camera_id] += thresh.astype(np.float32) / 255.0
+            if self.crop_to_motion:
+                self.motion_boxes[camera_id] = merge_boxes(
+                    self.motion_boxes.get(camera_id, []) + find_motion_boxes(frame_diff))
 
             self.prev_frames[camera_id] = gray
             self.last_processed_images[camera_id] = img
@@ -42,21 +159,108 @@ class ImageProcessor:
         self.prev_frames[camera_id] = gray
         return False
 
+    def detect_changes(self, frames):
+        # frames: camera_id -> image; one vectorized SSIM pass for all of them
+        scores = self.batch_detector.scores(frames)
+        for camera_id, score in scores.items():
+            self.change_magnitudes[camera_id] = 1.0 if score is None else 1.0 - score
+        return {camera_id: score is None or score < self.batch_detector.ssim_threshold
+                for camera_id, score in scores.items()}
+
     def get_last_processed_image(self, camera_id):
         return self.last_processed_images.get(camera_id)
 
     def get_last_processed_info(self, camera_id):
         return self.last_processed_info.get(camera_id, (None, None))
 
-    async def process_image_if_changed(self, camera_id, img):
-        should_process = await self.should_process_image(camera_id, img)
-        if should_process:
-            # Encode the image as PNG
-            _, buffer = cv2.imencode('.png', img)
-            base64_image = base64.b64encode(buffer).decode('utf-8')
-            
-            description, confidence = await process_image(base64_image)
+    async def describe(self, camera_id, img, on_partial=None):
+        if not vision_breaker.is_available:
+            # Degraded mode: remember the change and describe it once the server is back
+            self.pending_descriptions.add(camera_id)
+            return None, None
+
+        boxes = self.motion_boxes.pop(camera_id, None)
+        regions = self.motion_regions(img, boxes)
+        if regions is None:
+            description, confidence = await process_image(encode_png(img), on_partial)
+        else:
+            crops, thumbnail = regions
+            description, confidence = await process_image(
+                encode_png(crops[0]), on_partial, [encode_png(crop) for crop in crops[1:]],
+                encode_png(thumbnail) if thumbnail is not None else None)
+
+        if description is None or confidence is None:
+            self.pending_descriptions.add(camera_id)
+            if boxes:
+                # Keep the undescribed regions, together with any recorded while the request ran
+                self.motion_boxes[camera_id] = merge_boxes(boxes + self.motion_boxes.get(camera_id, []))
+            return description, confidence
+        self.pending_descriptions.discard(camera_id)
+        self.last_processed_info[camera_id] = (description, confidence)
+        return description, confidence
+
+    async def describe_mosaic(self, frames):
+        # frames: list of (camera_id, img), described in a single vision call; returns camera_id -> (description, confidence)
+        camera_ids = [camera_id for camera_id, _ in frames]
+        if not vision_breaker.is_available:
+            self.pending_descriptions.update(camera_ids)
+            return {}
+
+        # Tiles show whole frames, so the regions recorded so far are covered; a camera left undescribed
+        # gets its full frame sent next time
+        for camera_id in camera_ids:
+            self.motion_boxes.pop(camera_id, None)
+
+        mosaic = build_mosaic([img for _, img in frames])
+        text, confidence = await process_mosaic(encode_png(mosaic), len(frames))
+        tiles = parse_mosaic_description(text, len(frames)) if text is not None and confidence is not None else {}
+
+        results = {}
+        for tile, camera_id in enumerate(camera_ids, start=1):
+            description = tiles.get(tile)
+            if description is None:
+                self.pending_descriptions.add(camera_id)
+                continue
+            self.pending_descriptions.discard(camera_id)
             self.last_processed_info[camera_id] = (description, confidence)
+            results[camera_id] = (description, confidence)
+        return results
+
+    def motion_regions(self, img, boxes):
+        # (crops, thumbnail) for the changed regions, None when the full frame should be sent instead
+        if not boxes:
+            return None
+        height, width = img.shape[:2]
+        if sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in boxes) > MOTION_MAX_CROP_FRACTION * width * height:
+            return None
+        crops = [img[y0:y1, x0:x1] for x0, y0, x1, y1 in boxes]
+        thumbnail = None
+        if 0 < MOTION_THUMBNAIL_WIDTH < width:
+            thumbnail_size = (MOTION_THUMBNAIL_WIDTH, max(1, height * MOTION_THUMBNAIL_WIDTH // width))
+            thumbnail = cv2.resize(img, thumbnail_size, interpolation=cv2.INTER_AREA)
+        return crops, thumbnail
+
+    async def record_change(self, camera_id, img, changed=None):
+        # True when this frame changed; with changed given (batch detection) only the bookkeeping is done
+        if changed is None:
+            return await self.should_process_image(camera_id, img)
+        return self.record_frame(camera_id, img, changed)
+
+    async def detect_change(self, camera_id, img, changed=None):
+        # True when the camera needs a description: it changed now or an earlier change is still undescribed
+        changed = await self.record_change(camera_id, img, changed)
+        return changed or camera_id in self.pending_descriptions
+
+    async def process_image_if_changed(self, camera_id, img, on_partial=None, changed=None):
+        if await self.detect_change(camera_id, img, changed):
+            if not vision_breaker.is_available:
+                self.pending_descriptions.add(camera_id)
+                description, confidence = self.get_last_processed_info(camera_id)
+                return description, confidence, False
+
+            description, confidence = await self.describe(camera_id, img, on_partial)
+            if description is None or confidence is None:
+                return description, confidence, False
             return description, confidence, True
         else:
             logger.info(f"Image for camera {camera_id} hasn't changed significantly. Returning last processed info.")
@@ -0,0 +1,81 @@
+import json
+import logging
+from facility_snapshot import CAMERA_FIELD, write_snapshot_fields, read_facility_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class LatestValueCache:
+    def __init__(self):
+        self.entries = {}  # camera_id -> {'description', 'timestamp', 'data_id', 'frame'}
+        self.redis_client = None
+        self.mirrored = {}  # camera_id -> snapshot record last written to Redis
+        self.loaded_from_db = False
+
+    def attach_redis(self, redis_client):
+        # Mirror the newest values into the facility snapshot so other processes can read them too
+        self.redis_client = redis_client
+
+    async def record_result(self, camera_id, timestamp, description, data_id, frame):
+        self.entries[camera_id] = {'description': description, 'timestamp': timestamp, 'data_id': data_id, 'frame': frame}
+        await self.mirror(camera_id)
+
+    async def record_timestamp(self, camera_id, timestamp):
+        entry = self.entries.get(camera_id)
+        if entry is None:
+            return
+        entry['timestamp'] = timestamp
+        await self.mirror(camera_id)
+
+    async def mirror(self, camera_id):
+        if self.redis_client is None:
+            return
+        record = self.snapshot_record(camera_id)
+        previous = self.mirrored.get(camera_id)
+        if record == previous:
+            return
+        # An unchanged frame only refreshes the timestamp; that is written without a new version
+        bump_version = previous is None or dict(previous, timestamp=None) != dict(record, timestamp=None)
+        try:
+            await write_snapshot_fields(self.redis_client, {CAMERA_FIELD + camera_id: json.dumps(record)}, bump_version)
+            self.mirrored[camera_id] = record
+        except Exception as e:
+            logger.error(f"Error mirroring latest values for camera {camera_id}: {str(e)}")
+
+    def snapshot_record(self, camera_id):
+        entry = self.entries.get(camera_id) or {}
+        timestamp = entry.get('timestamp')
+        return {
+            'description': entry.get('description'),
+            'timestamp': timestamp.isoformat() if timestamp else None,
+            'data_id': entry.get('data_id'),
+        }
+
+    def load(self, camera_id, **values):
+        # Fill from a database read without overwriting anything the write path already set
+        entry = self.entries.setdefault(camera_id, {'description': None, 'timestamp': None, 'data_id': None, 'frame': None})
+        for key, value in values.items():
+            if entry[key] is None:
+                entry[key] = value
+
+    def get(self, camera_id, key):
+        entry = self.entries.get(camera_id)
+        return entry[key] if entry else None
+
+    async def latest_descriptions(self):
+        descriptions = {}
+        if self.redis_client is not None:
+            try:
+                snapshot = await read_facility_snapshot(self.redis_client)
+                for camera_id, values in snapshot['cameras'].items():
+                    if values.get('description') is not None:
+                        descriptions[camera_id] = values['description']
+            except Exception as e:
+                logger.error(f"Error reading mirrored latest values: {str(e)}")
+        for camera_id, entry in self.entries.items():
+            if entry['description'] is not None:
+                descriptions[camera_id] = entry['description']
+        return descriptions
+
+
+latest_cache = LatestValueCache()
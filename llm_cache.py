@@ -0,0 +1,102 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from config import LLM_CACHE_TTL, LLM_CACHE_SIZE, LLM_CACHE_REDIS_PREFIX, LLM_CACHE_STATS_KEY
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(model, messages, max_tokens):
+    payload = json.dumps({'model': model, 'messages': messages, 'max_tokens': max_tokens}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, ttl=LLM_CACHE_TTL, max_size=LLM_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.redis_client = None
+        self.hits = 0
+        self.misses = 0
+
+    def attach_redis(self, redis_client):
+        # Share hits between consumer instances
+        self.redis_client = redis_client
+
+    def _get_local(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def _set_local(self, key, value, ttl):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def get(self, key):
+        value = self._get_local(key)
+        if value is None and self.redis_client is not None:
+            try:
+                cached = await self.redis_client.get(LLM_CACHE_REDIS_PREFIX + key)
+                if cached is not None:
+                    value = cached.decode('utf-8')
+                    ttl = await self.redis_client.ttl(LLM_CACHE_REDIS_PREFIX + key)
+                    self._set_local(key, value, ttl if ttl > 0 else self.ttl)
+            except Exception as e:
+                logger.error(f"Error reading LLM cache from Redis: {str(e)}")
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key, value):
+        self._set_local(key, value, self.ttl)
+        if self.redis_client is not None:
+            try:
+                await self.redis_client.set(LLM_CACHE_REDIS_PREFIX + key, value, expire=self.ttl)
+            except Exception as e:
+                logger.error(f"Error writing LLM cache to Redis: {str(e)}")
+
+    async def get_or_call(self, key, call):
+        value = await self.get(key)
+        if value is not None:
+            return value
+        value = await call()
+        if value is not None:
+            await self.set(key, value)
+        return value
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hit_rate, 4),
+            'size': len(self.entries),
+        }
+
+    async def export_stats(self, redis_client):
+        stats = self.stats()
+        logger.info(f"LLM cache stats: {stats}")
+        try:
+            await redis_client.hmset_dict(LLM_CACHE_STATS_KEY, stats)
+        except Exception as e:
+            logger.error(f"Error exporting LLM cache stats: {str(e)}")
+
+
+llm_cache = LLMCache()
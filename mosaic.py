@@ -0,0 +1,48 @@
+import math
+import re
+import cv2
+import numpy as np
+from config import MOSAIC_TILE_SIZE
+
+# "3: two people", "Tile 3 - two people", "**3.** two people". Only markdown or list markup may precede the number
+# and a digit may not follow its separator, so "2 people near the door", "12:30 ..." or "1.5 metres ..." continue a tile
+TILE_LINE_PATTERN = re.compile(r'^[\s*#>\-]*(?:(?:tile|view|camera|image)\s*)?(\d+)\s*[:.)\-](?!\d)[\s*]*(.*)$', re.IGNORECASE)
+
+
+def build_mosaic(images, tile_size=MOSAIC_TILE_SIZE):
+    # Tiles the images row by row in a square-ish grid, each labelled 1..N in its top-left corner
+    tile_width, tile_height = tile_size
+    columns = math.ceil(math.sqrt(len(images)))
+    rows = math.ceil(len(images) / columns)
+    mosaic = np.zeros((rows * tile_height, columns * tile_width, 3), dtype=np.uint8)
+    for i, img in enumerate(images):
+        row, column = divmod(i, columns)
+        tile = cv2.resize(img, (tile_width, tile_height), interpolation=cv2.INTER_AREA)
+        label = str(i + 1)
+        (text_width, text_height), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 1.0, 2)
+        cv2.rectangle(tile, (0, 0), (text_width + 12, text_height + baseline + 12), (0, 0, 0), -1)
+        cv2.putText(tile, label, (6, text_height + 6), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+        # A thin border keeps neighbouring scenes from reading as one
+        cv2.rectangle(tile, (0, 0), (tile_width - 1, tile_height - 1), (255, 255, 255), 1)
+        mosaic[row * tile_height:(row + 1) * tile_height, column * tile_width:(column + 1) * tile_width] = tile
+    return mosaic
+
+
+def parse_mosaic_description(text, tile_count):
+    # Returns tile number (1-based) -> description; tiles the model skipped are missing
+    descriptions = {}
+    current = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        match = TILE_LINE_PATTERN.match(line)
+        if match:
+            # Numbers outside the grid are ignored, together with anything that follows them
+            current = int(match.group(1)) if 1 <= int(match.group(1)) <= tile_count else None
+            if current is not None:
+                descriptions[current] = match.group(2).strip(' *')
+        elif current is not None:
+            # Continuation of the previous tile's description
+            descriptions[current] = f"{descriptions[current]} {line}".strip()
+    return {tile: description for tile, description in descriptions.items() if description}
@@ -1,16 +1,100 @@
 import logging
+import re
 from openai import AsyncOpenAI
-from config import OPENAI_BASE_URL, OPENAI_API_KEY, OPENAI_VISION_URL, camera_names, camera_indexes
-from datetime import datetime
-import pytz
+from config import OPENAI_BASE_URL, OPENAI_API_KEY, OPENAI_VISION_URL, VISION_STREAMING, VISION_MAX_SENTENCES, LLM_CACHE_ENABLED, STATE_CLASSIFIER_ENABLED, LLM_MAX_TIMEOUT
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from llm_cache import llm_cache, make_cache_key
+from state_classifier import state_classifier
+from time_windows import schedule_engine
 
 
 logger = logging.getLogger(__name__)
 
-client = AsyncOpenAI(base_url=OPENAI_BASE_URL, api_key=OPENAI_API_KEY)
-vision_client = AsyncOpenAI(base_url=OPENAI_VISION_URL, api_key=OPENAI_API_KEY)
+# Timeouts and retries are handled by the circuit breakers
+client = AsyncOpenAI(base_url=OPENAI_BASE_URL, api_key=OPENAI_API_KEY, timeout=LLM_MAX_TIMEOUT, max_retries=0)
+vision_client = AsyncOpenAI(base_url=OPENAI_VISION_URL, api_key=OPENAI_API_KEY, timeout=LLM_MAX_TIMEOUT, max_retries=0)
+
+# One breaker per server, so both clients share it when they point at the same one
+llm_breaker = CircuitBreaker('llm')
+vision_breaker = llm_breaker if OPENAI_VISION_URL == OPENAI_BASE_URL else CircuitBreaker('vision')
+
+async def cached_completion(model, messages, max_tokens, on_llm_answer=None):
+    # on_llm_answer is only called for answers that came from the LLM, not from the cache
+    async def call():
+        completion = await llm_breaker.call(
+            client.chat.completions.create,
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+        )
+        answer = completion.choices[0].message.content
+        if on_llm_answer is not None:
+            on_llm_answer(answer)
+        return answer
+
+    if not LLM_CACHE_ENABLED:
+        return await call()
+    return await llm_cache.get_or_call(make_cache_key(model, messages, max_tokens), call)
+
+SENTENCE_END_PATTERN = re.compile(r'[.!?]+(?=\s)')
+
+def completed_sentence_ends(text):
+    return [match.end() for match in SENTENCE_END_PATTERN.finditer(text)]
+
+async def stream_description(messages, on_partial=None):
+    stream = await vision_client.chat.completions.create(
+        model="llava",
+        messages=messages,
+        max_tokens=200,
+        stream=True,
+    )
+
+    description = ""
+    sentences_sent = 0
+    try:
+        async for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            description += chunk.choices[0].delta.content
+
+            sentence_ends = completed_sentence_ends(description)
+            if VISION_MAX_SENTENCES and len(sentence_ends) >= VISION_MAX_SENTENCES:
+                # Enough text for the dashboard, stop generating the rest
+                description = description[:sentence_ends[VISION_MAX_SENTENCES - 1]]
+                break
+            if on_partial and len(sentence_ends) > sentences_sent:
+                sentences_sent = len(sentence_ends)
+                await on_partial(description[:sentence_ends[-1]].strip())
+    finally:
+        # Closing the response makes the server stop generating
+        await stream.close()
+
+    return description.strip()
+
+def image_part(base64_image):
+    return {
+        "type": "image_url",
+        "image_url": {
+            "url": f"data:image/png;base64,{base64_image}"
+        },
+    }
+
+async def process_image(base64_image, on_partial=None, region_images=(), thumbnail=None):
+    # With crop to motion, base64_image is the first changed region, region_images any further ones
+    # and thumbnail a small picture of the whole scene
+    if region_images or thumbnail:
+        prompt = "These are close-ups of the areas that changed in a security camera view"
+        if thumbnail:
+            prompt += ", followed by a small picture of the whole scene for context"
+        prompt += ". What's in these images?"
+    else:
+        prompt = "What's in this image?"
+
+    content = [{"type": "text", "text": prompt}, image_part(base64_image)]
+    content.extend(image_part(region) for region in region_images)
+    if thumbnail:
+        content.append(image_part(thumbnail))
 
-async def process_image(base64_image):
     messages = [
         {
             "role": "system",
@@ -18,26 +102,54 @@ async def process_image(base64_image):
         },
         {
             "role": "user",
-            "content": [
-                {"type": "text", "text": "What's in this image?"},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/png;base64,{base64_image}"
-                    },
-                },
-            ],
+            "content": content,
         }
     ]
 
     try:
-        completion = await vision_client.chat.completions.create(
+        if VISION_STREAMING:
+            return await vision_breaker.call(stream_description, messages, on_partial), 0.0
+
+        completion = await vision_breaker.call(
+            vision_client.chat.completions.create,
             model="llava",
             messages=messages,
             max_tokens=200,
         )
 
         return completion.choices[0].message.content, 0.0
+    except CircuitOpenError:
+        return None, None
+    except Exception as e:
+        logger.error(f"LLM completion error: {str(e)}")
+        return None, None
+
+async def process_mosaic(base64_image, tile_count):
+    # One call for a labelled grid of camera views; the answer is split per tile by mosaic.parse_mosaic_description
+    prompt = (f"This image is a grid of {tile_count} separate security camera views, each labelled with a number "
+              f"in its top-left corner. Describe what's in each view on its own line, formatted as "
+              f"\"<number>: <description>\", for every number from 1 to {tile_count}.")
+    messages = [
+        {
+            "role": "system",
+            "content": "This is a chat between a user and an assistant. The assistant is helping the user to describe an image.",
+        },
+        {
+            "role": "user",
+            "content": [{"type": "text", "text": prompt}, image_part(base64_image)],
+        }
+    ]
+
+    try:
+        completion = await vision_breaker.call(
+            vision_client.chat.completions.create,
+            model="llava",
+            messages=messages,
+            max_tokens=100 * tile_count,
+        )
+        return completion.choices[0].message.content, 0.0
+    except CircuitOpenError:
+        return None, None
     except Exception as e:
         logger.error(f"LLM completion error: {str(e)}")
         return None, None
@@ -48,7 +160,7 @@ async def process_facility_state(all_recent_descriptions):
 Most Recent Descriptions from all cameras: {all_recent_descriptions}"""
 
     try:
-        completion = await client.chat.completions.create(
+        return await cached_completion(
             model="llava",
             messages=[
                 {"role": "system", "content": "You are an AI tasked with determining the overall current state of a facility based on the most recent security camera descriptions from all areas."},
@@ -56,48 +168,22 @@ Most Recent Descriptions from all cameras: {all_recent_descriptions}"""
             ],
             max_tokens=100,
         )
-        
-        return completion.choices[0].message.content
     except Exception as e:
         return f"Error processing facility state: {str(e)}"
 
-async def process_camera_state(camera_id, aggregated_description):
-    from datetime import datetime
-    import pytz
-    from state_processing import time_zone_str
-
-    # First check if this is the AXIS camera and if we're in specific time windows
-    if camera_id == "AXIS_ID":
-        # Get current time in the specified timezone
-        tz = pytz.timezone(time_zone_str)
-        current_time = datetime.now(tz)
-        hour = current_time.hour
-        minute = current_time.minute
-        weekday = current_time.weekday()  # 0-6 (Monday-Sunday)
-        
-        # Convert current time to minutes since midnight for easier comparison
-        current_minutes = hour * 60 + minute
-        
-        # Define time windows (in minutes since midnight)
-        time_windows = [
-            (4*60 + 30, 5*60),      # 4:30 AM - 5:00 AM
-            (7*60 + 15, 12*60),     # 7:15 AM - 12:00 PM
-            (12*60 + 30, 13*60),    # 12:30 PM - 1:00 PM
-            (19*60, 20*60),         # 7:00 PM - 8:00 PM
-        ]
-        
-        # Add the weekday-specific windows
-        if weekday > 5:  # Saturday-Sunday
-            time_windows.append((13*60, 16*60))  # 1:00 PM - 4:00 PM
-        if weekday < 6:  # Monday-Saturday
-            time_windows.append((16*60 + 15, 17*60 + 45))  # 4:15 PM - 5:45 PM
-        else:  # Sunday
-            time_windows.append((16*60, 16*60 + 30))       # 4:00 PM - 4:30 PM
-            
-        # Check if current time falls within any of the windows
-        for start, end in time_windows:
-            if start <= current_minutes <= end:
-                return "nothing"
+async def process_camera_state(camera_id, aggregated_description, snapshot=None, llm_labels=None):
+    if snapshot is None:
+        snapshot = schedule_engine.snapshot()
+
+    # Cameras inside one of their configured quiet windows are not evaluated
+    if snapshot.is_quiet(camera_id):
+        return "nothing"
+
+    # Settle the clear-cut cases locally and only send ambiguous ones to the LLM
+    if STATE_CLASSIFIER_ENABLED:
+        local_state = state_classifier.classify(camera_id, aggregated_description)
+        if local_state is not None:
+            return local_state
 
     # Continue with the existing logic for other cases
     additional_state = ""
@@ -126,30 +212,36 @@ Rules:
 
 Output: one or more of the predefined states only. If you cannot determine a state, output “nothing”. Do not output any other text."""
 
+    def record_label(state):
+        # Cached answers were already recorded when the LLM gave them
+        if llm_labels is not None and state:
+            llm_labels.append((camera_id, aggregated_description, state))
+
     try:
-        completion = await client.chat.completions.create(
+        return await cached_completion(
             model="llava",
             messages=[
                 {"role": "system", "content": "You are an AI tasked with determining the state of a specific area in a facility based on aggregated security descriptions of a scene over 1 hour.  Look for patterns in the instant descriptions over the whole time period to determine the state."},
                 {"role": "user", "content": prompt}
             ],
             max_tokens=20,
+            on_llm_answer=record_label,
         )
-
-        return completion.choices[0].message.content
     except Exception as e:
         return f"Error processing camera state: {str(e)}"
 
-async def process_camera_states(hourly_aggregated_descriptions):
+async def process_camera_states(hourly_aggregated_descriptions, llm_labels=None, snapshot=None):
+    # camera_id -> state; facility_snapshot.display_camera_states keys them by camera name for Django
     camera_states = {}
+    # One snapshot of the schedule rules for the whole pass
+    if snapshot is None:
+        snapshot = schedule_engine.snapshot()
     for camera_id, aggregated_description in hourly_aggregated_descriptions.items():
-        state = await process_camera_state(camera_id, aggregated_description)
-        
-        from state_processing import is_night_time, time_zone_str
+        state = await process_camera_state(camera_id, aggregated_description, snapshot, llm_labels)
         
-        if is_night_time(time_zone_str):
+        if snapshot.is_night_time:
             state += ", night-time"
-        camera_states[camera_names[camera_id]+' '+str(camera_indexes[camera_id])] = state
+        camera_states[camera_id] = state
     return camera_states
 
 async def process_descriptions_for_presence(descriptions):
@@ -158,7 +250,7 @@ async def process_descriptions_for_presence(descriptions):
 Descriptions: {descriptions} Based on these descriptions is there a single person or people present or religious or spiritual gathering? Answer only yes or no. Only output yes or no, no other words."""
 
     try:
-        completion = await client.chat.completions.create(
+        answer = await cached_completion(
             model="llava",
             messages=[
                 {"role": "system", "content": "You are an AI tasked with determining if people are present based on security camera descriptions."},
@@ -167,7 +259,7 @@ Descriptions: {descriptions} Based on these descriptions is there a single perso
             max_tokens=10,
         )
 
-        return completion.choices[0].message.content.strip().lower()
+        return answer.strip().lower()
     except Exception as e:
         logger.error(f"LLM completion error: {str(e)}")
         return None
\ No newline at end of file
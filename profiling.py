@@ -0,0 +1,165 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from config import PROFILE_DIR, PROFILE_SECONDS, PROFILE_SAMPLE_INTERVAL, PROFILE_SLOW_CALLBACK
+
+logger = logging.getLogger(__name__)
+
+
+class CoroutineStats:
+    def __init__(self):
+        self.calls = 0
+        self.wall_time = 0.0
+        self.blocking_time = 0.0
+        self.max_blocking_step = 0.0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'wall_time': round(self.wall_time, 6),
+            'blocking_time': round(self.blocking_time, 6),
+            'max_blocking_step': round(self.max_blocking_step, 6),
+        }
+
+
+class TimedCoroutine:
+    # Drives a coroutine step by step; each send() runs synchronously on the loop, so its duration is blocking time
+    def __init__(self, coro, stats):
+        self.coro = coro
+        self.stats = stats
+
+    def __await__(self):
+        stats = self.stats
+        stats.calls += 1
+        started = time.perf_counter()
+        value, error = None, None
+        try:
+            while True:
+                step_start = time.perf_counter()
+                try:
+                    if error is not None:
+                        yielded = self.coro.throw(error)
+                    else:
+                        yielded = self.coro.send(value)
+                except StopIteration as e:
+                    return e.value
+                finally:
+                    step = time.perf_counter() - step_start
+                    stats.blocking_time += step
+                    stats.max_blocking_step = max(stats.max_blocking_step, step)
+                try:
+                    value, error = (yield yielded), None
+                except BaseException as e:
+                    value, error = None, e
+        finally:
+            stats.wall_time += time.perf_counter() - started
+
+
+class StackSampler(threading.Thread):
+    def __init__(self, thread_id, interval):
+        super().__init__(name='stack-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def write_collapsed(self, path):
+        # One "frame;frame;frame count" line per stack, readable by flamegraph.pl and speedscope
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class AsyncProfiler:
+    def __init__(self):
+        self.active = False
+        self.coroutine_stats = {}
+        self.task = None  # the running profile; the event loop only keeps a weak reference to tasks
+
+    def stats_for(self, name):
+        return self.coroutine_stats.setdefault(name, CoroutineStats())
+
+    def track(self, name):
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not self.active:
+                    return await func(*args, **kwargs)
+                return await TimedCoroutine(func(*args, **kwargs), self.stats_for(name))
+            return wrapper
+        return decorator
+
+    def start(self, seconds=PROFILE_SECONDS):
+        if self.active or (self.task is not None and not self.task.done()):
+            logger.warning("Profiling already running, ignoring request")
+            return None
+        self.task = asyncio.ensure_future(self.run(seconds))
+        return self.task
+
+    async def run(self, seconds):
+        loop = asyncio.get_running_loop()
+        self.active = True
+        self.coroutine_stats = {}
+        debug, slow_callback_duration = loop.get_debug(), loop.slow_callback_duration
+        # asyncio logs every callback slower than this, naming the task and coroutine
+        loop.set_debug(True)
+        loop.slow_callback_duration = PROFILE_SLOW_CALLBACK
+
+        sampler = StackSampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL)
+        sampler.start()
+        logger.info(f"Profiling for {seconds}s")
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop_event.set()
+            loop.set_debug(debug)
+            loop.slow_callback_duration = slow_callback_duration
+            self.active = False
+
+        await loop.run_in_executor(None, self.write_results, sampler)
+
+    def write_results(self, sampler):
+        sampler.join()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        prefix = os.path.join(PROFILE_DIR, f"profile-{time.strftime('%Y%m%d-%H%M%S')}")
+        sampler.write_collapsed(f"{prefix}.collapsed")
+        with open(f"{prefix}-coroutines.json", 'w') as f:
+            json.dump({name: stats.as_dict() for name, stats in self.coroutine_stats.items()}, f, indent=2)
+        logger.info(f"Profile written to {prefix}.collapsed and {prefix}-coroutines.json")
+
+    def handle_request(self, request):
+        # Request payload is either empty, a number of seconds or {"seconds": N}
+        seconds = PROFILE_SECONDS
+        try:
+            payload = json.loads(request) if request else None
+            if isinstance(payload, dict):
+                seconds = float(payload.get('seconds', seconds))
+            elif payload is not None:
+                seconds = float(payload)
+        except (ValueError, TypeError):
+            logger.error(f"Invalid profiling request: {request}")
+        return self.start(seconds)
+
+    def install_signal_handler(self, signum=signal.SIGUSR1):
+        asyncio.get_running_loop().add_signal_handler(signum, self.start)
+
+
+profiler = AsyncProfiler()
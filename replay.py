@@ -0,0 +1,111 @@
+import argparse
+import asyncio
+import glob
+import heapq
+import logging
+import os
+import time
+from contextlib import contextmanager
+from unittest.mock import patch
+import consumer
+import image_processing
+from consumer import FrameProcessor
+from frame_recorder import read_segment, camera_id_for_segment, SEGMENT_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+
+class StubLLM:
+    def __init__(self):
+        self.calls = 0
+
+    async def process_image(self, base64_image, on_partial=None, region_images=(), thumbnail=None):
+        self.calls += 1
+        return f"replayed description {self.calls}", 0.0
+
+
+async def noop(*args, **kwargs):
+    return None
+
+
+@contextmanager
+def stubbed_services():
+    # The LLM, database and websocket replaced with stubs, restored on exit
+    stub = StubLLM()
+    with patch.object(image_processing, 'process_image', stub.process_image), \
+            patch.object(consumer, 'store_results', noop), \
+            patch.object(consumer, 'update_timestamp', noop), \
+            patch.object(consumer, 'send_to_django', noop):
+        yield stub
+
+
+def find_segments(paths, cameras=None):
+    segments = []
+    for path in paths:
+        if os.path.isdir(path):
+            segments.extend(glob.glob(os.path.join(path, '**', '*' + SEGMENT_SUFFIX), recursive=True))
+        else:
+            segments.append(path)
+    if cameras:
+        segments = [segment for segment in segments if camera_id_for_segment(segment) in cameras]
+    return sorted(segments)
+
+
+async def replay(segments, ssim_threshold=None, speed=0.0):
+    # Offline run: the LLM, database and websocket are replaced with stubs
+    with stubbed_services() as stub:
+        frame_processor = FrameProcessor()
+        if ssim_threshold is not None:
+            frame_processor.image_processor.ssim_threshold = ssim_threshold
+
+        # Interleave all cameras in recording order, as the consumer saw them
+        records = heapq.merge(*(read_segment(segment) for segment in segments), key=lambda record: record[0])
+
+        frames = 0
+        first_recorded_at = last_recorded_at = None
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        for recorded_at, payload in records:
+            if first_recorded_at is None:
+                first_recorded_at = recorded_at
+            last_recorded_at = recorded_at
+            if speed > 0:
+                delay = (recorded_at - first_recorded_at) / speed - (time.perf_counter() - wall_start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await frame_processor.process_frame(bytes(payload), None, None)
+            frames += 1
+
+        wall_time = time.perf_counter() - wall_start
+        recorded_span = (last_recorded_at - first_recorded_at) if frames else 0.0
+        return {
+            'ssim_threshold': frame_processor.image_processor.ssim_threshold,
+            'frames': frames,
+            'llm_calls': stub.calls,
+            'cpu_seconds': round(time.process_time() - cpu_start, 3),
+            'wall_seconds': round(wall_time, 3),
+            'recorded_seconds': round(recorded_span, 3),
+            'speedup': round(recorded_span / wall_time, 1) if wall_time > 0 else None,
+        }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Replay recorded camera frames through FrameProcessor with the LLM stubbed")
+    parser.add_argument('paths', nargs='+', help="segment files or recording directories")
+    parser.add_argument('--cameras', nargs='*', help="only replay these camera ids")
+    parser.add_argument('--ssim-threshold', type=float, nargs='*', default=[None],
+                        help="one replay per threshold, to compare settings")
+    parser.add_argument('--speed', type=float, default=0.0, help="multiple of real time, 0 replays as fast as possible")
+    args = parser.parse_args()
+
+    segments = find_segments(args.paths, args.cameras)
+    if not segments:
+        parser.error("no segment files found")
+
+    for ssim_threshold in args.ssim_threshold:
+        print(await replay(segments, ssim_threshold, args.speed))
+
+
+if __name__ == "__main__":
+    # consumer configures INFO logging on import; per-frame logs would dominate the replay
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(main())
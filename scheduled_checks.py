@@ -1,74 +1,155 @@
 import asyncio
 import aiocron
-from datetime import datetime, time
+from datetime import datetime, timedelta
 import pytz
 import json
-import base64
-from openai_operations import process_image, process_descriptions_for_presence
-from db_operations import fetch_descriptions_for_timerange, connect_database
-from redis_operations import connect_redis, get_latest_frame_wrapper
-from collections import Counter
+from db_operations import fetch_descriptions_for_timerange, pin_latest_frame
+from connections import resources
+from circuit_breaker import jittered_backoff
+from config import TIME_ZONE, CURTAIN_CHECK_WINDOWS, CURTAIN_KEYWORDS
 import logging
 
 ALERT_QUEUE = 'alert_queue'
+ALERT_SENT_KEY = 'alert_sent:{}:{}:{}'  # camera_id, check_time, date
+ALERT_SENT_TTL = 24 * 60 * 60
+ALERT_ATTEMPTS = 3
+ALERT_RETRY_DELAY = 5  # seconds, doubled per attempt
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-async def check_curtains(redis_client, db_conn, camera_id, check_time, start_time, end_time):
-    try:
-        frame = await get_latest_frame_wrapper(db_conn, camera_id)
-        if frame is None:
-            logger.warning(f"No frame available for camera {camera_id} at {check_time}")
+def mentions_deities(descriptions):
+    descriptions = descriptions.lower()
+    return any(word in descriptions for word in CURTAIN_KEYWORDS)
+
+class CurtainWindow:
+    def __init__(self, camera_id, check_time, start_time, end_time):
+        self.camera_id = camera_id
+        self.check_time = check_time
+        self.start_time = start_time
+        self.end_time = end_time
+        self.date = None
+        self.observed = False
+        self.curtains_open = False
+        self.alerted = False
+
+    def reset(self, date):
+        self.date = date
+        self.observed = False
+        self.curtains_open = False
+        self.alerted = False
+
+    def observe(self, timestamp, description):
+        if not self.start_time <= timestamp.time() <= self.end_time:
             return
+        if self.date != timestamp.date():
+            self.reset(timestamp.date())
+        self.observed = True
+        if not self.curtains_open and description and mentions_deities(description):
+            self.curtains_open = True
 
-        # Convert frame to base64, handling different types
-        if isinstance(frame, memoryview):
-            frame_bytes = frame.tobytes()
-        elif isinstance(frame, bytes):
-            frame_bytes = frame
-        elif isinstance(frame, str):
-            frame_bytes = frame.encode('utf-8')
-        else:
-            logger.error(f"Unexpected frame type for camera {camera_id}: {type(frame)}")
+class CurtainCheckEngine:
+    def __init__(self, windows=CURTAIN_CHECK_WINDOWS):
+        self.tz = pytz.timezone(TIME_ZONE)
+        self.windows = [
+            CurtainWindow(camera_id, check_time,
+                          datetime.strptime(start, '%H:%M').time(), datetime.strptime(end, '%H:%M').time())
+            for camera_id, check_time, start, end in windows
+        ]
+        self.windows_by_camera = {}
+        for window in self.windows:
+            self.windows_by_camera.setdefault(window.camera_id, []).append(window)
+
+    def observe(self, camera_id, timestamp, description):
+        # Called for every description the consumer produces; cheap for cameras without windows
+        windows = self.windows_by_camera.get(camera_id)
+        if not windows:
             return
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(self.tz).replace(tzinfo=None)
+        for window in windows:
+            window.observe(timestamp, description)
+
+    async def check_window(self, redis_client, db_conn, window):
+        try:
+            today = datetime.now(self.tz).date()
+            if window.date != today:
+                window.reset(today)
+
+            if window.alerted:
+                return
 
-        frame_base64 = base64.b64encode(frame_bytes).decode('utf-8')
-        logger.info(f"Frame data type: {type(frame)}, base64 length: {len(frame_base64)}")
+            if not window.curtains_open and not window.observed:
+                # Nothing seen by this instance (cold start or another instance owns the camera)
+                descriptions = await fetch_descriptions_for_timerange(db_conn, window.camera_id, window.start_time, window.end_time)
+                if not descriptions:
+                    logger.warning(f"No descriptions available for camera {window.camera_id} between {window.start_time} and {window.end_time}")
+                    return
+                window.curtains_open = mentions_deities(descriptions)
 
-        descriptions = await fetch_descriptions_for_timerange(db_conn, camera_id, start_time, end_time)
-        if not descriptions:
-            logger.warning(f"No descriptions available for camera {camera_id} between {start_time} and {end_time}")
+            if window.curtains_open:
+                logger.info(f"Curtains are open for camera {window.camera_id} at {window.check_time}")
+                return
+
+            for attempt in range(1, ALERT_ATTEMPTS + 1):
+                try:
+                    await self.raise_alert(redis_client, db_conn, window, today)
+                    break
+                except Exception as e:
+                    # window.alerted is still unset, so a later check can alert if these attempts run out
+                    logger.error(f"Error raising alert for camera {window.camera_id} (attempt {attempt}): {str(e)}")
+                    if attempt < ALERT_ATTEMPTS:
+                        await asyncio.sleep(jittered_backoff(attempt, ALERT_RETRY_DELAY))
+        except Exception as e:
+            logger.error(f"Error in check_window for camera {window.camera_id}: {str(e)}")
+
+    async def raise_alert(self, redis_client, db_conn, window, today):
+        # Only one instance gets to alert for a window
+        sent_key = ALERT_SENT_KEY.format(window.camera_id, window.check_time, today.isoformat())
+        is_first = await redis_client.set(sent_key, 1, expire=ALERT_SENT_TTL, exist=redis_client.SET_IF_NOT_EXIST)
+        if not is_first:
+            logger.info(f"Alert for camera {window.camera_id} at {window.check_time} already sent")
+            window.alerted = True
             return
-        
-        if not any(word in descriptions.lower() for word in ["deities", "statues", "deity", "figures", "figure"]):
+
+        try:
+            # Only look up the frame now that there is something to report; pinned so the alert's frame is kept
+            frame_id = await pin_latest_frame(db_conn, window.camera_id)
             alert_data = {
-                'camera_id': camera_id,
-                'check_time': check_time,
-                'message': f"Curtains are closed for camera {camera_id} at {check_time}",
-                'frame': frame_base64
+                'camera_id': window.camera_id,
+                'check_time': window.check_time,
+                'message': f"Curtains are closed for camera {window.camera_id} at {window.check_time}",
+                'frame_id': frame_id
             }
             await redis_client.rpush(ALERT_QUEUE, json.dumps(alert_data))
-            logger.info(f"Alert pushed to queue for camera {camera_id}: Curtains closed")
-        else:
-            logger.info(f"Curtains are open for camera {camera_id} at {check_time}")
-    except Exception as e:
-        logger.error(f"Error in check_curtains for camera {camera_id}: {str(e)}")
+        except Exception:
+            # Nothing was sent, so give up the claim and let the next attempt (here or on another instance) take it
+            try:
+                await redis_client.delete(sent_key)
+            except Exception as e:
+                logger.error(f"Error releasing alert claim for camera {window.camera_id}: {str(e)}")
+            raise
+        window.alerted = True
+        logger.info(f"Alert pushed to queue for camera {window.camera_id}: Curtains closed")
+
+curtain_check_engine = CurtainCheckEngine()
 
 
 async def schedule_checks():
-    redis_client = await connect_redis()
-    db_conn = await connect_database()
-    
+    await resources.connect()
+    redis_client = resources.redis
+    db_conn = resources.db_conn
+
     # Set timezone
-    tz = pytz.timezone('America/New_York')
+    tz = pytz.timezone(TIME_ZONE)
 
-    # AXIS_ID checks
-    aiocron.crontab('33-38 12 * * *', func=check_curtains, args=(redis_client, db_conn, "AXIS_ID", "12:33pm", time(12,33), time(12,38)), start=True, tz=tz)
-    aiocron.crontab('18-22 16 * * *', func=check_curtains, args=(redis_client, db_conn, "AXIS_ID", "4:18pm", time(16,18), time(16,22)), start=True, tz=tz)
-    aiocron.crontab('3-8 19 * * *', func=check_curtains, args=(redis_client, db_conn, "AXIS_ID", "7:03pm", time(19,3), time(19,8)), start=True, tz=tz)
+    # Evaluate each window once, the minute after it closes
+    for window in curtain_check_engine.windows:
+        closes_at = (datetime.combine(datetime.min, window.end_time) + timedelta(minutes=1)).time()
+        aiocron.crontab(f'{closes_at.minute} {closes_at.hour} * * *', func=curtain_check_engine.check_window,
+                        args=(redis_client, db_conn, window), start=True, tz=tz)
 
 
 if __name__ == "__main__":
     asyncio.get_event_loop().run_until_complete(schedule_checks())
-    asyncio.get_event_loop().run_forever()
\ No newline at end of file
+    asyncio.get_event_loop().run_forever()
@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import logging
+import pickle
+import re
+from config import STATE_CLASSIFIER_MODEL, STATE_CLASSIFIER_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+try:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+except ImportError:
+    make_pipeline = None
+
+# Cameras whose prompt carries extra states (e.g. "door open") the rules can't see
+LLM_ONLY_CAMERAS = {"oaQllpjP0sk94nCV", "OSF13XTCKhpIkyXc"}
+
+NEGATED_PERSON_PATTERN = re.compile(
+    r"\b(?:no|not any|without any|without|devoid of)\s+(?:visible\s+|other\s+)?"
+    r"(?:people|persons?|humans?|individuals?|one|occupants?|visitors?|devotees?)\b"
+    r"|\bnobody\b|\bno-one\b|\bunoccupied\b|\bempty of people\b"
+    r"|\b(?:statues?|figures?) of (?:a|an|one)\s+(?:\w+\s+)?\w+"
+)
+# A person in a painting or photo may or may not be in the room too
+DEPICTION_PATTERN = re.compile(
+    r"\b(?:paintings?|pictures?|images?|posters?|photos?|photographs?|murals?|portraits?|drawings?)\s+(?:of|depicting|showing)\b"
+    r"|\bdepict(?:s|ing|ed)?\b"
+)
+PLURAL_PERSON_PATTERN = re.compile(
+    r"\b(?:people|persons|men|women|children|kids|crowd|crowds|group of|groups of|devotees|visitors|"
+    r"individuals|pujaris|staff|audience|several|multiple|couple of|(?:two|three|four|five|six|seven|eight|nine|ten|\d+)\s+"
+    r"(?:\w+\s+)?(?:people|persons|men|women|children|individuals|devotees|visitors))\b"
+)
+SINGLE_PERSON_PATTERN = re.compile(
+    # Not "man-made" or "a woman's handbag"
+    r"\b(?:a|one|single|lone|an)\s+(?:\w+\s+)?(?:person|man|woman|child|boy|girl|individual|devotee|visitor|pujari|worker)\b(?![-'’])"
+    r"|\bsomeone\b|\bsomebody\b"
+)
+ANY_PERSON_PATTERN = re.compile(
+    r"\b(?:person|people|persons|man|men|woman|women|child|children|kids?|boy|girl|human|humans|individual|"
+    r"individuals|someone|somebody|crowd|devotees?|visitors?|pujaris?|staff|worker|workers|audience|he|she)\b"
+)
+# Anything that hints at a state the rules can't decide goes to the LLM
+AMBIGUOUS_PATTERN = re.compile(
+    r"\b(?:eat|eating|eats|meal|meals|dining|festival|ceremony|celebration|kirtan|kirtans|prayer|praying|worship|"
+    r"gathering|gathered|dancing|chanting|singing|performance|busy|bustling)\b"
+)
+
+STATE_NOTHING = "nothing"
+STATE_SINGLE = "single person present"
+
+
+def classify_by_rules(description):
+    text = NEGATED_PERSON_PATTERN.sub(" ", description.lower())
+    if DEPICTION_PATTERN.search(text) or AMBIGUOUS_PATTERN.search(text) or PLURAL_PERSON_PATTERN.search(text):
+        return None
+    single_mentions = SINGLE_PERSON_PATTERN.findall(text)
+    if not single_mentions and not ANY_PERSON_PATTERN.search(text):
+        return STATE_NOTHING
+    if len(single_mentions) == 1:
+        return STATE_SINGLE
+    return None
+
+
+def normalize_state(state):
+    return state.strip().strip('."\'“”').lower()
+
+
+class StateClassifier:
+    def __init__(self, model_path=STATE_CLASSIFIER_MODEL, threshold=STATE_CLASSIFIER_THRESHOLD):
+        self.threshold = threshold
+        self.model = None
+        if model_path:
+            self.load_model(model_path)
+
+    def load_model(self, model_path):
+        try:
+            with open(model_path, 'rb') as f:
+                self.model = pickle.load(f)
+            logger.info(f"Loaded state classifier model from {model_path}")
+        except Exception as e:
+            logger.error(f"Failed to load state classifier model from {model_path}: {str(e)}")
+            self.model = None
+
+    def classify_with_model(self, description):
+        if self.model is None:
+            return None
+        probabilities = self.model.predict_proba([description])[0]
+        best = probabilities.argmax()
+        if probabilities[best] >= self.threshold:
+            return self.model.classes_[best]
+        return None
+
+    def classify(self, camera_id, description):
+        # Returns a state for confident cases, None when the LLM should decide
+        if camera_id in LLM_ONLY_CAMERAS or not description:
+            return None
+        state = classify_by_rules(description)
+        if state is None:
+            state = self.classify_with_model(description)
+        return state
+
+
+def train_model(descriptions, states):
+    if make_pipeline is None:
+        raise RuntimeError("scikit-learn is required to train the state classifier")
+    model = make_pipeline(
+        TfidfVectorizer(ngram_range=(1, 2), min_df=2),
+        LogisticRegression(max_iter=1000),
+    )
+    model.fit(descriptions, states)
+    return model
+
+
+def agreement_report(classifier, labels):
+    decided = agreed = 0
+    for camera_id, description, llm_state in labels:
+        state = classifier.classify(camera_id, description)
+        if state is None:
+            continue
+        decided += 1
+        if state == normalize_state(llm_state):
+            agreed += 1
+    total = len(labels)
+    return {
+        'samples': total,
+        'decided_locally': decided,
+        'coverage': round(decided / total, 4) if total else 0.0,
+        'agreement': round(agreed / decided, 4) if decided else 0.0,
+    }
+
+
+async def main():
+    from db_operations import connect_database, fetch_state_labels
+
+    parser = argparse.ArgumentParser(description="Train or evaluate the local camera-state classifier against past LLM outputs")
+    parser.add_argument('command', choices=['train', 'report'])
+    parser.add_argument('--model', default=STATE_CLASSIFIER_MODEL or 'state_classifier.pkl')
+    parser.add_argument('--limit', type=int, default=50000)
+    args = parser.parse_args()
+
+    conn = await connect_database()
+    labels = await fetch_state_labels(conn, args.limit)
+    conn.close()
+
+    if args.command == 'train':
+        model = train_model([description for _, description, _ in labels],
+                            [normalize_state(state) for _, _, state in labels])
+        with open(args.model, 'wb') as f:
+            pickle.dump(model, f)
+        logger.info(f"Trained state classifier on {len(labels)} samples, saved to {args.model}")
+
+    print(f"Rules only: {agreement_report(StateClassifier(model_path=None), labels)}")
+    if args.command == 'train' or STATE_CLASSIFIER_MODEL:
+        print(f"Rules + model: {agreement_report(StateClassifier(model_path=args.model), labels)}")
+
+
+state_classifier = StateClassifier()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(main())
@@ -1,31 +1,17 @@
 import json
 import logging
 from openai_operations import process_facility_state, process_camera_states
-from db_operations import fetch_latest_descriptions, fetch_hourly_aggregated_descriptions, fetch_aggregated_descriptions
+from db_operations import fetch_latest_descriptions, fetch_hourly_aggregated_descriptions, fetch_aggregated_descriptions, store_state_labels
 from redis_operations import publish_state_result
-import pytz
-from datetime import datetime
-
-def is_night_time(time_zone_str):
-    # Define night-time hours (e.g., 8 PM to 6 AM)
-    night_start = 20  # 8 PM
-    night_end = 3     # 3 AM
-
-    # Get the current time in the specified time zone
-    time_zone = pytz.timezone(time_zone_str)
-    current_time = datetime.now(time_zone)
-    current_hour = current_time.hour
-
-    # Check if the current hour is within night-time hours
-    if night_start <= current_hour or current_hour < night_end:
-        return True
-    return False
-
-# Example usage
-time_zone_str = 'America/New_York'
+from facility_snapshot import facility_snapshot, display_camera_states
+from latest_cache import latest_cache
+from time_windows import schedule_engine
+from llm_cache import llm_cache
+from profiling import profiler
 
 logger = logging.getLogger(__name__)
 
+@profiler.track('process_state')
 async def process_state(db_conn, redis_client):
     try:
         # Fetch the latest descriptions for all cameras (for facility state)
@@ -34,22 +20,41 @@ async def process_state(db_conn, redis_client):
         # Fetch aggregated descriptions from last hour for each camera (for camera states)
         aggregated_descriptions = await fetch_aggregated_descriptions(db_conn)
         
-        # Process overall facility state
+        # Process overall facility state, unless the descriptions are the same as last pass
         all_recent_descriptions = " ".join(latest_descriptions.values())
-        facility_state = await process_facility_state(all_recent_descriptions)
+        facility_changed = facility_snapshot.facility_changed(all_recent_descriptions)
+        if facility_changed:
+            facility_snapshot.update_facility(all_recent_descriptions, await process_facility_state(all_recent_descriptions))
+        
+        # Process individual camera states, only for cameras whose inputs changed since the last pass
+        schedule = schedule_engine.snapshot()
+        changed_descriptions = facility_snapshot.changed_cameras(aggregated_descriptions, schedule)
+        llm_labels = []
+        changed_states = await process_camera_states(changed_descriptions, llm_labels, schedule)
+        facility_snapshot.update_cameras(changed_descriptions, schedule, changed_states)
+        
+        # Keep the LLM's answers as training data for the local classifier
+        await store_state_labels(db_conn, llm_labels)
         
-        # Process individual camera states
-        camera_states = await process_camera_states(aggregated_descriptions)
+        # Update the facility snapshot hash; without the write-path mirror its descriptions are written here
+        camera_records = None
+        if latest_cache.redis_client is None:
+            camera_records = {camera_id: dict(latest_cache.snapshot_record(camera_id), description=description)
+                              for camera_id, description in changed_descriptions.items()}
+        version = await facility_snapshot.publish(redis_client, changed_states, facility_changed, camera_records)
         
         # Send results to Redis for Django to pick up
         state_result = json.dumps({
-            'facility_state': facility_state,
-            'camera_states': camera_states
+            'facility_state': facility_snapshot.facility_state,
+            'camera_states': display_camera_states(facility_snapshot.camera_states),
+            'version': version,
         })
         await publish_state_result(redis_client, state_result)
+        await llm_cache.export_stats(redis_client)
         
-        print(f"Facility State: {facility_state}")
-        print(f"Camera States: {camera_states}")
+        print(f"Facility State: {facility_snapshot.facility_state}")
+        print(f"Camera States: {display_camera_states(facility_snapshot.camera_states)}")
+        print(f"Recomputed {len(changed_states)} camera states, snapshot version {version}")
         
     except Exception as e:
-        logger.error(f"Error processing state: {str(e)}")
\ No newline at end of file
+        logger.error(f"Error processing state: {str(e)}")
@@ -0,0 +1,81 @@
+import pytest
+import asyncio
+from unittest.mock import AsyncMock
+import sys
+import os
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError, jittered_backoff, CLOSED, OPEN, HALF_OPEN
+
+def make_breaker():
+    return CircuitBreaker('test', failure_threshold=2, timeout=1, min_timeout=0.01, max_timeout=1,
+                          recovery_time=0.0, max_recovery_time=0.0)
+
+def test_jittered_backoff_is_bounded():
+    for attempt in range(1, 10):
+        delay = jittered_backoff(attempt, 1, max_delay=8)
+        assert min(8, 2 ** (attempt - 1)) / 2 <= delay <= min(8, 2 ** (attempt - 1))
+
+@pytest.mark.asyncio
+async def test_opens_after_threshold_and_rejects_calls():
+    breaker = make_breaker()
+    breaker.recovery_time = breaker.max_recovery_time = 60
+    failing = AsyncMock(side_effect=ConnectionError("down"))
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            await breaker.call(failing)
+
+    assert breaker.state == OPEN
+    assert not breaker.is_available
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(failing)
+    assert failing.call_count == 2
+
+@pytest.mark.asyncio
+async def test_half_open_probe_closes_on_success():
+    breaker = make_breaker()
+    breaker.trip()
+
+    assert breaker.is_available
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time
+    assert not breaker.is_available
+    assert not breaker.allow_request()
+
+    breaker.record_success(0.1)
+    assert breaker.state == CLOSED
+    assert breaker.consecutive_opens == 0
+
+@pytest.mark.asyncio
+async def test_failed_probe_reopens():
+    breaker = make_breaker()
+    breaker.trip()
+    failing = AsyncMock(side_effect=ConnectionError("still down"))
+
+    with pytest.raises(ConnectionError):
+        await breaker.call(failing)
+
+    assert breaker.state == OPEN
+    assert breaker.consecutive_opens == 2
+
+@pytest.mark.asyncio
+async def test_slow_calls_time_out():
+    breaker = make_breaker()
+    breaker.timeout = 0.01
+
+    with pytest.raises(asyncio.TimeoutError):
+        await breaker.call(asyncio.sleep, 1)
+    assert breaker.failures == 1
+
+def test_timeout_adapts_to_latency():
+    breaker = make_breaker()
+    for _ in range(20):
+        breaker.record_success(0.1)
+    assert 0.1 <= breaker.timeout < 0.2
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,103 @@
+import pytest
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+import sys
+import os
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import connections
+from connections import ResourceRegistry
+
+def clients():
+    redis = MagicMock()
+    redis.wait_closed = AsyncMock()
+    return {'redis': redis, 'db_conn': MagicMock(), 'pool': AsyncMock(), 'websocket': AsyncMock()}
+
+@pytest.fixture
+def backends():
+    connected = clients()
+
+    def connector(name):
+        async def connect():
+            await asyncio.sleep(0.01)
+            return connected[name]
+        return AsyncMock(side_effect=connect)
+
+    mocks = {
+        'connect_redis': connector('redis'),
+        'connect_database': connector('db_conn'),
+        'connect_pool': connector('pool'),
+        'connect_websocket': connector('websocket'),
+    }
+    with patch.multiple(connections, **mocks):
+        yield connected, mocks
+
+@pytest.mark.asyncio
+async def test_concurrent_connects_share_one_set_of_clients(backends):
+    connected, mocks = backends
+    registry = ResourceRegistry()
+
+    results = await asyncio.gather(*(registry.connect() for _ in range(5)))
+
+    assert all(result is registry for result in results)
+    assert registry.is_ready
+    assert registry.redis is connected['redis'] and registry.pool is connected['pool']
+    for mock in mocks.values():
+        mock.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_partial_failure_closes_connected_clients(backends):
+    connected, mocks = backends
+    never_connects = asyncio.Event()
+
+    async def hang():
+        await never_connects.wait()
+
+    for name, client in (('connect_redis', 'redis'), ('connect_pool', 'pool')):
+        mocks[name].side_effect = None
+        mocks[name].return_value = connected[client]
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("schema migration failed")
+
+    mocks['connect_database'].side_effect = fail
+    mocks['connect_websocket'].side_effect = hang
+    registry = ResourceRegistry()
+
+    with pytest.raises(RuntimeError):
+        await registry.connect()
+
+    # Redis and the pool connected before the failure and are closed again; the websocket attempt is cancelled
+    connected['redis'].close.assert_called_once()
+    connected['pool'].close.assert_called_once()
+    connected['websocket'].close.assert_not_called()
+    assert not registry.is_ready
+    assert (registry.redis, registry.db_conn, registry.pool, registry.websocket) == (None, None, None, None)
+
+    mocks['connect_database'].side_effect = None
+    mocks['connect_database'].return_value = connected['db_conn']
+    mocks['connect_websocket'].side_effect = None
+    mocks['connect_websocket'].return_value = connected['websocket']
+    assert (await registry.connect()).is_ready
+
+@pytest.mark.asyncio
+async def test_close_is_idempotent(backends):
+    connected, mocks = backends
+    registry = ResourceRegistry()
+    await registry.connect()
+
+    await asyncio.gather(registry.close(), registry.close())
+    await registry.close()
+
+    connected['redis'].close.assert_called_once()
+    connected['redis'].wait_closed.assert_called_once()
+    connected['db_conn'].close.assert_called_once()
+    connected['pool'].close.assert_called_once()
+    connected['websocket'].close.assert_called_once()
+    assert not registry.is_ready
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
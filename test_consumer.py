@@ -0,0 +1,89 @@
+import pytest
+import asyncio
+import numpy as np
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+import sys
+import os
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import consumer
+from consumer import FrameProcessor
+from frame_scheduler import DescriptionScheduler
+
+TIMESTAMP = datetime(2024, 1, 1, 12)
+
+@pytest.fixture
+def stubbed():
+    with patch.object(consumer, 'store_results', AsyncMock()) as store_results, \
+            patch.object(consumer, 'update_timestamp', AsyncMock()), \
+            patch.object(consumer, 'send_to_django', AsyncMock()):
+        yield store_results
+
+@pytest.mark.asyncio
+async def test_polls_during_slow_describe_do_not_queue_duplicates(stubbed):
+    frame_processor = FrameProcessor(DescriptionScheduler(deadline=60, half_life=30, importance={}))
+    image_processor = frame_processor.image_processor
+    release = asyncio.Event()
+
+    async def slow_describe(camera_id, img, on_partial=None):
+        await release.wait()
+        image_processor.pending_descriptions.discard(camera_id)
+        return "a person", 0.0
+
+    image_processor.describe = slow_describe
+    img = np.zeros((90, 160, 3), dtype=np.uint8)
+
+    async def poll(frame):
+        await frame_processor.schedule_frame('a', 0, TIMESTAMP, b'jpeg', frame, None, None)
+
+    await poll(img)
+    frame = frame_processor.scheduler.pop()
+    describing = asyncio.ensure_future(frame_processor.describe_frame(frame, None, None))
+    await asyncio.sleep(0)
+
+    # The same frame polled again while its description is in flight
+    for _ in range(3):
+        await poll(img)
+    assert len(frame_processor.scheduler) == 0
+
+    # A real change during the request is still queued
+    changed = img.copy()
+    changed[20:70, 40:120] = 255
+    await poll(changed)
+    assert len(frame_processor.scheduler) == 1
+
+    release.set()
+    await describing
+    assert frame_processor.describing == set()
+    stubbed.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_describe_worker_survives_errors_and_cancels(stubbed):
+    frame_processor = FrameProcessor(DescriptionScheduler(deadline=60, half_life=30, importance={}))
+    described = []
+
+    async def describe_frame(frame, pool, websocket):
+        described.append(frame.camera_id)
+        if frame.camera_id == 'a':
+            raise RuntimeError("bad frame")
+
+    frame_processor.describe_frame = describe_frame
+    img = np.zeros((90, 160, 3), dtype=np.uint8)
+    await frame_processor.schedule_frame('a', 0, TIMESTAMP, b'jpeg', img, None, None)
+
+    with patch.object(consumer, 'RETRY_DELAY', 0):
+        worker = asyncio.ensure_future(frame_processor.describe_worker(None, None))
+        await asyncio.sleep(0.01)
+        await frame_processor.schedule_frame('b', 1, TIMESTAMP, b'jpeg', img, None, None)
+        await asyncio.sleep(0.01)
+
+        assert described == ['a', 'b']
+        worker.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await worker
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
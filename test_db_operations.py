@@ -0,0 +1,110 @@
+import pytest
+from contextlib import asynccontextmanager
+from datetime import datetime, time
+from unittest.mock import MagicMock, AsyncMock, patch
+import sys
+import os
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db_operations
+from latest_cache import LatestValueCache
+
+TIMESTAMP = datetime(2024, 1, 1, 12)
+
+def make_pool(previous):
+    conn = MagicMock()
+    conn.fetchval = AsyncMock(side_effect=[11, 500])  # description id, then binary data id
+    conn.fetchrow = AsyncMock(return_value=previous)
+    conn.execute = AsyncMock()
+
+    @asynccontextmanager
+    async def transaction():
+        yield
+
+    @asynccontextmanager
+    async def acquire():
+        yield conn
+
+    conn.transaction = transaction
+    pool = MagicMock()
+    pool.acquire = acquire
+    return pool, conn
+
+def executed(conn):
+    return [(' '.join(call[0][0].split()), call[0][1:]) for call in conn.execute.call_args_list]
+
+@pytest.fixture(autouse=True)
+def cache():
+    cache = LatestValueCache()
+    with patch.object(db_operations, 'latest_cache', cache):
+        yield cache
+
+@pytest.mark.asyncio
+async def test_store_results_extends_run_of_same_description(cache):
+    pool, conn = make_pool({'id': 3, 'data_id': 400, 'description_id': 11})
+
+    data_id = await db_operations.store_results(pool, 'AXIS_ID', 17, TIMESTAMP, 'Deities on the altar', 0.0, b'jpeg', 'Axis')
+
+    assert data_id == 500
+    (update, update_args), (delete, delete_args) = executed(conn)
+    assert update.startswith('UPDATE visionmon_metadata SET repeat_count = repeat_count + 1')
+    assert update_args == (3, TIMESTAMP, 500, 0.0)
+    assert delete.startswith('DELETE FROM visionmon_binary_data') and 'NOT pinned' in delete
+    assert delete_args == (400,)
+    assert cache.get('AXIS_ID', 'data_id') == 500
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('previous', [None, {'id': 3, 'data_id': 400, 'description_id': 10}])
+async def test_store_results_starts_new_row(previous):
+    pool, conn = make_pool(previous)
+
+    await db_operations.store_results(pool, 'AXIS_ID', 17, TIMESTAMP, 'Curtains closed', 0.0, b'jpeg', 'Axis')
+
+    ((insert, args),) = executed(conn)
+    assert insert.startswith('INSERT INTO visionmon_metadata')
+    # data_id, camera_id, camera_index, timestamp (also first_timestamp), inline description, description_id, confidence, camera_name
+    assert args == (500, 'AXIS_ID', 17, TIMESTAMP, 'Curtains closed', 11, 0.0, 'Axis')
+    description_hash = conn.fetchval.call_args_list[0][0][1]
+    assert len(description_hash) == 64
+
+@pytest.mark.asyncio
+async def test_timerange_query_matches_overlapping_runs():
+    conn = MagicMock()
+    cursor = conn.cursor.return_value
+    cursor.fetchone.return_value = ('Curtains closed (x4)',)
+
+    result = await db_operations.fetch_descriptions_for_timerange(conn, 'AXIS_ID', time(12, 33), time(12, 38))
+
+    assert result == 'Curtains closed (x4)'
+    query, params = cursor.execute.call_args[0]
+    query = ' '.join(query.split())
+    placeholders = ['vm.camera_id = %s',
+                    'COALESCE(vm.first_timestamp, vm.timestamp) < %s',
+                    'vm.timestamp >= %s']
+    # The run starts before the window ends and ends after it starts, in the order the parameters are passed
+    positions = [query.index(placeholder) for placeholder in placeholders]
+    assert positions == sorted(positions) and query.count('%s') == 3
+    # Full timestamps, so a run that began yesterday and is still going matches today's window
+    assert 'CAST' not in query and 'CURRENT_DATE' not in query
+    today = datetime.now().date()
+    assert params == ('AXIS_ID', datetime.combine(today, time(12, 39)), datetime.combine(today, time(12, 33)))
+
+@pytest.mark.asyncio
+async def test_aggregated_queries_count_collapsed_repeats():
+    conn = MagicMock()
+    cursor = conn.cursor.return_value
+    cursor.fetchall.return_value = [('AXIS_ID', 'Curtains closed (x4) Deities on the altar')]
+
+    assert await db_operations.fetch_hourly_aggregated_descriptions(conn) == {'AXIS_ID': 'Curtains closed (x4) Deities on the altar'}
+    query = ' '.join(cursor.execute.call_args[0][0].split())
+    assert 'SUM(vm.repeat_count) AS occurrences' in query
+    assert db_operations.COUNTED_TEXT in query
+
+    cursor.fetchall.return_value = [('AXIS_ID', 'Curtains closed')]
+    assert await db_operations.fetch_aggregated_descriptions(conn) == {'AXIS_ID': 'Curtains closed'}
+    assert db_operations.DESCRIPTION_TEXT in cursor.execute.call_args[0][0]
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,96 @@
+import pytest
+import json
+from unittest.mock import AsyncMock, patch
+import sys
+import os
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import state_processing
+from facility_snapshot import FacilitySnapshot, read_facility_snapshot
+from latest_cache import LatestValueCache
+
+class Schedule:
+    def __init__(self, quiet=(), is_night_time=False):
+        self.quiet = set(quiet)
+        self.is_night_time = is_night_time
+
+    def is_quiet(self, camera_id):
+        return camera_id in self.quiet
+
+@pytest.fixture
+def state_pass():
+    descriptions = {'AXIS_ID': 'Deities on the altar', 'LRqgKMMjjJbNEeyE': 'An empty field'}
+    schedule = Schedule()
+
+    async def camera_states(changed, llm_labels, snapshot):
+        return {camera_id: f"state of {description}" for camera_id, description in changed.items()}
+
+    mocks = {
+        'fetch_latest_descriptions': AsyncMock(side_effect=lambda conn: dict(descriptions)),
+        'fetch_aggregated_descriptions': AsyncMock(side_effect=lambda conn: dict(descriptions)),
+        'process_facility_state': AsyncMock(return_value="nothing"),
+        'process_camera_states': AsyncMock(side_effect=camera_states),
+        'store_state_labels': AsyncMock(),
+        'publish_state_result': AsyncMock(),
+    }
+    with patch.multiple(state_processing, **mocks), \
+            patch.object(state_processing, 'facility_snapshot', FacilitySnapshot()), \
+            patch.object(state_processing, 'latest_cache', LatestValueCache()), \
+            patch.object(state_processing.schedule_engine, 'snapshot', side_effect=lambda: schedule), \
+            patch.object(state_processing.llm_cache, 'export_stats', AsyncMock()):
+        yield descriptions, schedule, mocks
+
+@pytest.mark.asyncio
+async def test_only_changed_cameras_are_recomputed(state_pass, fake_redis):
+    descriptions, schedule, mocks = state_pass
+    redis_client = fake_redis
+
+    await state_processing.process_state(None, redis_client)
+    descriptions['LRqgKMMjjJbNEeyE'] = 'A man in the field'
+    await state_processing.process_state(None, redis_client)
+
+    second_pass = mocks['process_camera_states'].call_args_list[1][0][0]
+    assert second_pass == {'LRqgKMMjjJbNEeyE': 'A man in the field'}
+    assert mocks['process_facility_state'].call_count == 2
+
+    published = json.loads(mocks['publish_state_result'].call_args[0][1])
+    assert published['camera_states'] == {'Axis 17': 'state of Deities on the altar', 'Field 6': 'state of A man in the field'}
+    snapshot = await read_facility_snapshot(redis_client)
+    assert snapshot['version'] == published['version'] == 2
+    assert snapshot['facility_state'] == 'nothing'
+    assert snapshot['cameras']['LRqgKMMjjJbNEeyE'] == {'description': 'A man in the field', 'timestamp': None,
+                                                       'data_id': None, 'state': 'state of A man in the field'}
+
+@pytest.mark.asyncio
+async def test_schedule_changes_and_errors_are_recomputed(state_pass, fake_redis):
+    descriptions, schedule, mocks = state_pass
+    redis_client = fake_redis
+    mocks['process_facility_state'].return_value = "Error processing facility state: timeout"
+
+    await state_processing.process_state(None, redis_client)
+    schedule.quiet.add('AXIS_ID')
+    await state_processing.process_state(None, redis_client)
+    await state_processing.process_state(None, redis_client)
+
+    assert [list(call[0][0]) for call in mocks['process_camera_states'].call_args_list] == \
+        [['AXIS_ID', 'LRqgKMMjjJbNEeyE'], ['AXIS_ID'], []]
+    # A failed facility state is retried every pass
+    assert mocks['process_facility_state'].call_count == 3
+
+@pytest.mark.asyncio
+async def test_unchanged_states_leave_version_unchanged(fake_redis):
+    snapshot = FacilitySnapshot()
+    snapshot.facility_state = 'nothing'
+
+    assert await snapshot.publish(fake_redis, {'AXIS_ID': 'open'}, True) == 1
+    # Recomputed, but to the same values
+    assert await snapshot.publish(fake_redis, {'AXIS_ID': 'open'}, True) == 1
+    assert fake_redis.hash['version'] == '1'
+
+    assert await snapshot.publish(fake_redis, {'AXIS_ID': 'closed'}, False) == 2
+    assert fake_redis.hash['state:AXIS_ID'] == 'closed'
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,37 @@
+import pytest
+import sys
+import os
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from frame_recorder import FrameRecorder, read_segment, segment_path, camera_id_for_segment
+
+def test_record_and_read_back(tmp_path):
+    recorder = FrameRecorder(str(tmp_path))
+    assert recorder.record('AXIS_ID', b'frame-1', recorded_at=1000.0)
+    # Repeated reads of the same Redis value are skipped
+    assert not recorder.record('AXIS_ID', b'frame-1', recorded_at=1001.0)
+    assert recorder.record('AXIS_ID', b'frame-2', recorded_at=1002.0)
+    recorder.close()
+
+    path = segment_path(str(tmp_path), 'AXIS_ID', 1000.0)
+    assert camera_id_for_segment(path) == 'AXIS_ID'
+    records = [(recorded_at, bytes(payload)) for recorded_at, payload in read_segment(path)]
+    assert records == [(1000.0, b'frame-1'), (1002.0, b'frame-2')]
+
+def test_read_stops_at_torn_record(tmp_path):
+    recorder = FrameRecorder(str(tmp_path))
+    recorder.record('AXIS_ID', b'complete', recorded_at=1000.0)
+    recorder.record('AXIS_ID', b'truncated', recorded_at=1001.0)
+    recorder.close()
+
+    path = segment_path(str(tmp_path), 'AXIS_ID', 1000.0)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 3)
+
+    records = [(recorded_at, bytes(payload)) for recorded_at, payload in read_segment(path)]
+    assert records == [(1000.0, b'complete')]
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
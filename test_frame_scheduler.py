@@ -0,0 +1,87 @@
+import pytest
+import asyncio
+from unittest.mock import patch
+import sys
+import os
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from frame_scheduler import DescriptionScheduler, PendingFrame
+
+def frame(camera_id, magnitude, enqueued_at):
+    with patch('frame_scheduler.time.monotonic', return_value=enqueued_at):
+        return PendingFrame(camera_id, 0, None, b'', None, magnitude)
+
+def pop_at(scheduler, now):
+    with patch('frame_scheduler.time.monotonic', return_value=now):
+        return scheduler.pop()
+
+def test_larger_and_more_important_changes_first():
+    scheduler = DescriptionScheduler(deadline=60, half_life=30, importance={'temple': 3.0})
+    scheduler.push(frame('hall', 0.1, 100))
+    scheduler.push(frame('field', 0.4, 100))
+    scheduler.push(frame('temple', 0.2, 100))
+
+    assert [pop_at(scheduler, 101).camera_id for _ in range(3)] == ['temple', 'field', 'hall']
+    assert pop_at(scheduler, 101) is None
+
+def test_older_frames_lose_priority():
+    scheduler = DescriptionScheduler(deadline=600, half_life=30, importance={})
+    scheduler.push(frame('hall', 0.4, 100))
+    # A quarter of the change, but 90s (three half-lives) newer
+    scheduler.push(frame('field', 0.1, 190))
+
+    assert pop_at(scheduler, 191).camera_id == 'field'
+
+def test_newest_frame_per_camera_replaces_older():
+    scheduler = DescriptionScheduler(deadline=60, half_life=30, importance={})
+    scheduler.push(frame('hall', 0.5, 100))
+    newer = frame('hall', 0.01, 105)
+    scheduler.push(newer)
+
+    assert len(scheduler) == 1
+    popped = pop_at(scheduler, 106)
+    assert popped is newer
+    assert popped.change_magnitude == 0.5
+    assert scheduler.superseded == 1
+    assert pop_at(scheduler, 106) is None
+
+def test_frames_past_deadline_are_dropped():
+    scheduler = DescriptionScheduler(deadline=60, half_life=30, importance={})
+    scheduler.push(frame('hall', 0.5, 100))
+    scheduler.push(frame('field', 0.1, 150))
+
+    assert pop_at(scheduler, 170).camera_id == 'field'
+    assert scheduler.expired == 1
+
+@pytest.mark.asyncio
+async def test_get_waits_for_work():
+    scheduler = DescriptionScheduler(deadline=60, half_life=30, importance={})
+    waiter = asyncio.ensure_future(scheduler.get())
+    await asyncio.sleep(0)
+    assert not waiter.done()
+
+    scheduler.push(PendingFrame('hall', 0, None, b'', None, 0.5))
+    assert (await asyncio.wait_for(waiter, 1)).camera_id == 'hall'
+
+def test_pop_many_takes_frames_in_priority_order():
+    scheduler = DescriptionScheduler(deadline=60, half_life=30, importance={})
+    for camera_id, magnitude in [('a', 0.1), ('b', 0.3), ('c', 0.2)]:
+        scheduler.push(frame(camera_id, magnitude, 100))
+
+    with patch('frame_scheduler.time.monotonic', return_value=101):
+        assert [f.camera_id for f in scheduler.pop_many(2)] == ['b', 'c']
+        assert [f.camera_id for f in scheduler.pop_many(5)] == ['a']
+
+def test_repolling_keeps_age_and_deadline():
+    scheduler = DescriptionScheduler(deadline=1.0, half_life=30, importance={})
+    for poll in range(5):
+        scheduler.push(frame('hall', 0.2, 100 + 0.6 * poll))
+
+    assert scheduler.pending['hall'].enqueued_at == 100
+    assert pop_at(scheduler, 102.4) is None
+    assert scheduler.expired == 1
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,119 @@
+import base64
+import cv2
+import pytest
+import numpy as np
+import sys
+import os
+from skimage.metrics import structural_similarity as ssim
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import image_processing
+from image_processing import ImageProcessor, batch_ssim, find_motion_boxes, merge_boxes
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 255, (3, 90, 160), dtype=np.uint8)
+
+def test_batch_ssim_matches_skimage(frames):
+    changed = frames.copy()
+    changed[1, 10:50, 20:90] = 0
+    changed[2] = frames[0]
+
+    scores = batch_ssim(frames, changed)
+
+    expected = [ssim(a, b) for a, b in zip(frames, changed)]
+    assert np.allclose(scores, expected)
+
+def test_detect_changes_per_camera(frames):
+    processor = ImageProcessor()
+    first = {camera_id: np.dstack([frame] * 3) for camera_id, frame in zip(['a', 'b'], frames)}
+    # Cameras seen for the first time are always processed
+    assert processor.detect_changes(first) == {'a': True, 'b': True}
+
+    second = dict(first)
+    second['b'] = np.dstack([frames[2]] * 3)
+    assert processor.detect_changes(second) == {'a': False, 'b': True}
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("change, expected", [
+    ('none', False),
+    ('sensor noise', False),
+    ('smaller object', False),
+    ('person', True),
+])
+async def test_batch_and_per_frame_detection_agree(change, expected):
+    rng = np.random.default_rng(0)
+    scene = cv2.GaussianBlur(rng.integers(0, 255, (360, 640, 3), dtype=np.uint8), (15, 15), 0)
+    img = scene.copy()
+    if change == 'sensor noise':
+        img = np.clip(scene.astype(int) + rng.integers(-3, 4, scene.shape), 0, 255).astype(np.uint8)
+    elif change == 'smaller object':
+        img[80:320, 280:400] = (40, 60, 200)
+    elif change == 'person':
+        img[80:360, 280:520] = (40, 60, 200)
+
+    per_frame = ImageProcessor()
+    await per_frame.should_process_image('a', scene)
+    batch = ImageProcessor()
+    batch.detect_changes({'a': scene})
+
+    # The batch threshold applies to downscaled frames; both paths make the same call
+    assert await per_frame.should_process_image('a', img) == expected
+    assert batch.detect_changes({'a': img}) == {'a': expected}
+
+@pytest.mark.asyncio
+async def test_record_frame_matches_should_process_image(frames):
+    processor = ImageProcessor()
+    img = np.dstack([frames[0]] * 3)
+    assert await processor.should_process_image('a', img)
+    assert not await processor.should_process_image('a', img)
+    assert processor.record_frame('a', np.dstack([frames[1]] * 3), True)
+    assert processor.change_accumulators['a'].max() > 0
+
+def test_find_motion_boxes_pads_changed_regions():
+    diff = np.zeros((200, 300), dtype=np.uint8)
+    diff[50:80, 40:70] = 100
+    diff[150:160, 250:260] = 100
+    diff[10, 10] = 255  # Noise below the minimum area
+
+    boxes = sorted(find_motion_boxes(diff, diff_threshold=25, min_area=400, padding=10))
+
+    assert len(boxes) == 1
+    x0, y0, x1, y1 = boxes[0]
+    assert x0 <= 30 and y0 <= 40 and x1 >= 80 and y1 >= 90
+
+def test_merge_boxes():
+    assert sorted(merge_boxes([(0, 0, 10, 10), (5, 5, 20, 20), (50, 50, 60, 60)])) == [(0, 0, 20, 20), (50, 50, 60, 60)]
+    # Too many separate regions become one crop
+    assert merge_boxes([(0, 0, 1, 1), (10, 10, 11, 11), (20, 20, 21, 21)], max_boxes=2) == [(0, 0, 21, 21)]
+
+@pytest.mark.asyncio
+async def test_describe_sends_motion_crop(monkeypatch):
+    calls = []
+
+    async def fake_process_image(base64_image, on_partial=None, region_images=(), thumbnail=None):
+        calls.append((base64_image, list(region_images), thumbnail))
+        return "a person", 0.0
+
+    monkeypatch.setattr(image_processing, 'process_image', fake_process_image)
+    processor = ImageProcessor()
+    processor.crop_to_motion = True
+    background = np.zeros((480, 640, 3), dtype=np.uint8)
+    moved = background.copy()
+    moved[100:200, 300:360] = 200
+
+    assert await processor.process_image_if_changed('a', background) == ("a person", 0.0, True)
+    assert calls[-1][1] == [] and calls[-1][2] is None  # First frame: the whole scene
+
+    assert await processor.process_image_if_changed('a', moved, changed=True) == ("a person", 0.0, True)
+    crop, regions, thumbnail = calls[-1]
+    assert thumbnail is not None and regions == []
+    height, width = cv2.imdecode(np.frombuffer(base64.b64decode(crop), np.uint8), cv2.IMREAD_COLOR).shape[:2]
+    assert 100 <= height < 480 and 60 <= width < 640
+    assert 'a' not in processor.motion_boxes
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,87 @@
+import pytest
+from unittest.mock import MagicMock, AsyncMock, patch
+from datetime import datetime
+import sys
+import os
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db_operations
+from latest_cache import LatestValueCache
+
+@pytest.fixture
+def cache():
+    cache = LatestValueCache()
+    with patch.object(db_operations, 'latest_cache', cache):
+        yield cache
+
+@pytest.mark.asyncio
+async def test_write_path_serves_frame_reads(cache):
+    await cache.record_result('AXIS_ID', datetime(2024, 1, 1, 12), 'Deities on the altar', 42, b'jpeg')
+    conn = MagicMock()
+
+    assert await db_operations.get_latest_frame(conn, 'AXIS_ID') == b'jpeg'
+    conn.cursor.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_latest_descriptions_hit_database_only_on_cold_start(cache):
+    conn = MagicMock()
+    conn.cursor.return_value.fetchall.return_value = [('AXIS_ID', 'old description'), ('LRqgKMMjjJbNEeyE', 'An empty field')]
+    await cache.record_result('AXIS_ID', datetime(2024, 1, 1, 12), 'new description', 1, b'jpeg')
+
+    first = await db_operations.fetch_latest_descriptions(conn)
+    await cache.record_result('LRqgKMMjjJbNEeyE', datetime(2024, 1, 1, 12), 'A man in the field', 2, b'jpeg')
+    second = await db_operations.fetch_latest_descriptions(conn)
+
+    # Values written by the consumer win over what the database returned
+    assert first == {'AXIS_ID': 'new description', 'LRqgKMMjjJbNEeyE': 'An empty field'}
+    assert second == {'AXIS_ID': 'new description', 'LRqgKMMjjJbNEeyE': 'A man in the field'}
+    conn.cursor.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_other_instances_writes_are_read_from_database(cache):
+    conn = MagicMock()
+    cursor = conn.cursor.return_value
+    await cache.record_result('AXIS_ID', datetime(2024, 1, 1, 12), 'Deities on the altar', 7, b'jpeg')
+
+    with patch.object(db_operations, 'MODULUS', 2):
+        cursor.fetchall.return_value = [('LRqgKMMjjJbNEeyE', 'old')]
+        assert await db_operations.fetch_latest_descriptions(conn) == {'LRqgKMMjjJbNEeyE': 'old'}
+        cursor.fetchall.return_value = [('LRqgKMMjjJbNEeyE', 'new from other instance')]
+        assert await db_operations.fetch_latest_descriptions(conn) == {'LRqgKMMjjJbNEeyE': 'new from other instance'}
+
+        cursor.fetchone.return_value = (b'other',)
+        assert await db_operations.get_latest_frame(conn, 'AXIS_ID') == b'other'
+        cursor.fetchone.return_value = (b'newer',)
+        assert await db_operations.get_latest_frame(conn, 'AXIS_ID') == b'newer'
+
+@pytest.mark.asyncio
+async def test_redis_mirror(cache, fake_redis):
+    redis_client = fake_redis
+    redis_client.hash['camera:IOKAu7MMacLh79zn'] = '{"description": "An empty temple", "timestamp": null, "data_id": 3}'
+    cache.attach_redis(redis_client)
+
+    await cache.record_result('AXIS_ID', datetime(2024, 1, 1, 12), 'Deities on the altar', 42, b'jpeg')
+    await cache.record_timestamp('AXIS_ID', datetime(2024, 1, 1, 12, 5))
+
+    # The refreshed timestamp is mirrored, but only the new description is a new version
+    assert redis_client.hash['version'] == '1'
+    assert '2024-01-01T12:05:00' in redis_client.hash['camera:AXIS_ID']
+    assert await cache.latest_descriptions() == {'IOKAu7MMacLh79zn': 'An empty temple', 'AXIS_ID': 'Deities on the altar'}
+
+@pytest.mark.asyncio
+async def test_identical_poll_leaves_version_unchanged(cache, fake_redis):
+    cache.attach_redis(fake_redis)
+    timestamp = datetime(2024, 1, 1, 12)
+
+    await cache.record_result('AXIS_ID', timestamp, 'Deities on the altar', 42, b'jpeg')
+    await cache.record_result('AXIS_ID', timestamp, 'Deities on the altar', 42, b'jpeg')
+    await cache.record_timestamp('AXIS_ID', timestamp)
+    assert fake_redis.hash['version'] == '1'
+
+    await cache.record_result('AXIS_ID', datetime(2024, 1, 1, 12, 5), 'A closed red curtain', 43, b'jpeg')
+    assert fake_redis.hash['version'] == '2'
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
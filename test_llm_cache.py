@@ -0,0 +1,75 @@
+import pytest
+from unittest.mock import AsyncMock
+import sys
+import os
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from llm_cache import LLMCache, make_cache_key
+
+def test_cache_key_depends_on_inputs():
+    messages = [{"role": "user", "content": "Temple: a man standing"}]
+    key = make_cache_key("llava", messages, 20)
+    assert key == make_cache_key("llava", list(messages), 20)
+    assert key != make_cache_key("llava", messages, 100)
+    assert key != make_cache_key("llava", [{"role": "user", "content": "Temple: nothing"}], 20)
+
+@pytest.mark.asyncio
+async def test_get_or_call_memoizes():
+    cache = LLMCache(ttl=60, max_size=10)
+    call = AsyncMock(return_value="nothing")
+
+    assert await cache.get_or_call("k", call) == "nothing"
+    assert await cache.get_or_call("k", call) == "nothing"
+
+    call.assert_called_once()
+    assert cache.hits == 1
+    assert cache.misses == 1
+    assert cache.hit_rate == 0.5
+
+@pytest.mark.asyncio
+async def test_failed_calls_are_not_cached():
+    cache = LLMCache(ttl=60, max_size=10)
+    call = AsyncMock(return_value=None)
+
+    await cache.get_or_call("k", call)
+    await cache.get_or_call("k", call)
+
+    assert call.call_count == 2
+
+@pytest.mark.asyncio
+async def test_lru_eviction():
+    cache = LLMCache(ttl=60, max_size=2)
+    await cache.set("a", "1")
+    await cache.set("b", "2")
+    await cache.get("a")
+    await cache.set("c", "3")
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") == "1"
+    assert await cache.get("c") == "3"
+
+@pytest.mark.asyncio
+async def test_expired_entries_are_dropped():
+    cache = LLMCache(ttl=-1, max_size=10)
+    await cache.set("a", "1")
+
+    assert await cache.get("a") is None
+    assert len(cache.entries) == 0
+
+@pytest.mark.asyncio
+async def test_redis_backed_hit():
+    redis_client = AsyncMock()
+    redis_client.get.return_value = b"single person present"
+    redis_client.ttl.return_value = 30
+    cache = LLMCache(ttl=60, max_size=10)
+    cache.attach_redis(redis_client)
+
+    assert await cache.get("k") == "single person present"
+    # Second read is served locally
+    assert await cache.get("k") == "single person present"
+    redis_client.get.assert_called_once_with("llm_cache:k")
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
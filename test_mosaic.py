@@ -0,0 +1,65 @@
+import pytest
+import numpy as np
+import sys
+import os
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import image_processing
+from image_processing import ImageProcessor
+from mosaic import build_mosaic, parse_mosaic_description
+
+def test_build_mosaic_grid():
+    images = [np.full((480, 640, 3), i * 40, dtype=np.uint8) for i in range(5)]
+    mosaic = build_mosaic(images, tile_size=(160, 90))
+    # Five tiles fit a 3 x 2 grid
+    assert mosaic.shape == (180, 480, 3)
+    assert mosaic[150, 250].tolist() == [160, 160, 160]  # Inside tile 5 (second row, second column)
+
+def test_parse_mosaic_description():
+    text = """Here is what I see:
+1: An empty prayer hall.
+**2.** Two people lighting candles,
+near the altar.
+Tile 4 - A crowded courtyard
+7: Out of range"""
+
+    assert parse_mosaic_description(text, 4) == {
+        1: "An empty prayer hall.",
+        2: "Two people lighting candles, near the altar.",
+        4: "A crowded courtyard",
+    }
+
+def test_parse_mosaic_description_continuations_starting_with_numbers():
+    text = """- **Tile 1:** A courtyard.
+2 people near the door,
+12:30 on the wall clock,
+1.5 metres from the gate.
+**Tile 2:** Nobody
+Camera 3) A man at the altar
+0: Out of range"""
+
+    assert parse_mosaic_description(text, 3) == {
+        1: "A courtyard. 2 people near the door, 12:30 on the wall clock, 1.5 metres from the gate.",
+        2: "Nobody",
+        3: "A man at the altar",
+    }
+
+@pytest.mark.asyncio
+async def test_describe_mosaic_leaves_skipped_tiles_pending(monkeypatch):
+    async def fake_process_mosaic(base64_image, tile_count):
+        return "1: a person\n3: nobody", 0.0
+
+    monkeypatch.setattr(image_processing, 'process_mosaic', fake_process_mosaic)
+    processor = ImageProcessor()
+    img = np.zeros((90, 160, 3), dtype=np.uint8)
+
+    results = await processor.describe_mosaic([('a', img), ('b', img), ('c', img)])
+
+    assert results == {'a': ("a person", 0.0), 'c': ("nobody", 0.0)}
+    assert processor.pending_descriptions == {'b'}
+    assert processor.get_last_processed_info('c') == ("nobody", 0.0)
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,79 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+import sys
+import os
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import openai_operations
+from openai_operations import stream_description, completed_sentence_ends
+
+class FakeStream:
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.consumed = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.consumed == len(self.pieces):
+            raise StopAsyncIteration
+        piece = self.pieces[self.consumed]
+        self.consumed += 1
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+    async def close(self):
+        self.closed = True
+
+def streaming(pieces):
+    stream = FakeStream(pieces)
+    create = AsyncMock(return_value=stream)
+    return stream, patch.object(openai_operations.vision_client.chat.completions, 'create', create)
+
+PIECES = ["A man ", "walks in.", " He sits", " down! Two", " cats sleep", ". The end", " of it."]
+
+def test_completed_sentence_ends():
+    # A sentence only counts as complete once whitespace follows its punctuation
+    assert completed_sentence_ends("One. Two!? Three.") == [4, 10]
+
+@pytest.mark.asyncio
+async def test_partials_sent_at_sentence_boundaries():
+    partials = AsyncMock()
+    stream, create = streaming(PIECES)
+    with create, patch.object(openai_operations, 'VISION_MAX_SENTENCES', 0):
+        description = await stream_description([], partials)
+
+    assert description == "A man walks in. He sits down! Two cats sleep. The end of it."
+    assert [call[0][0] for call in partials.call_args_list] == [
+        "A man walks in.",
+        "A man walks in. He sits down!",
+        "A man walks in. He sits down! Two cats sleep.",
+    ]
+    assert stream.closed
+
+@pytest.mark.asyncio
+async def test_stops_after_max_sentences():
+    partials = AsyncMock()
+    stream, create = streaming(PIECES)
+    with create, patch.object(openai_operations, 'VISION_MAX_SENTENCES', 2):
+        description = await stream_description([], partials)
+
+    assert description == "A man walks in. He sits down!"
+    assert [call[0][0] for call in partials.call_args_list] == ["A man walks in."]
+    # The rest of the response is never read and the stream is closed so the server stops generating
+    assert stream.consumed == 4
+    assert stream.closed
+
+@pytest.mark.asyncio
+async def test_stream_closed_when_callback_fails():
+    stream, create = streaming(PIECES)
+    with create, pytest.raises(RuntimeError):
+        await stream_description([], AsyncMock(side_effect=RuntimeError("websocket closed")))
+    assert stream.closed
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,108 @@
+import pytest
+import asyncio
+import glob
+import json
+from unittest.mock import patch
+import sys
+import os
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import profiling
+from profiling import AsyncProfiler
+
+@pytest.fixture
+def profiler():
+    profiler = AsyncProfiler()
+    profiler.active = True
+    return profiler
+
+@pytest.mark.asyncio
+async def test_tracked_coroutine_returns_value(profiler):
+    @profiler.track('work')
+    async def work(x):
+        await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        return x * 2
+
+    assert await work(21) == 42
+    stats = profiler.coroutine_stats['work']
+    assert stats.calls == 1
+    assert stats.wall_time >= 0.01
+    # Time spent suspended in sleep is not blocking time
+    assert stats.blocking_time < stats.wall_time
+
+@pytest.mark.asyncio
+async def test_tracked_coroutine_propagates_exceptions(profiler):
+    @profiler.track('failing')
+    async def failing():
+        await asyncio.sleep(0)
+        raise ValueError("bad frame")
+
+    @profiler.track('recovering')
+    async def recovering():
+        # Exceptions thrown into the coroutine at an await reach its own handlers
+        try:
+            await failing()
+        except ValueError:
+            return "recovered"
+
+    assert await recovering() == "recovered"
+    with pytest.raises(ValueError):
+        await failing()
+    assert profiler.coroutine_stats['failing'].calls == 2
+
+@pytest.mark.asyncio
+async def test_tracked_coroutine_propagates_cancellation(profiler):
+    cleaned_up = asyncio.Event()
+
+    @profiler.track('waiting')
+    async def waiting():
+        try:
+            await asyncio.sleep(10)
+        finally:
+            cleaned_up.set()
+
+    task = asyncio.ensure_future(waiting())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert cleaned_up.is_set()
+    assert profiler.coroutine_stats['waiting'].wall_time > 0
+
+@pytest.mark.asyncio
+async def test_stats_only_collected_while_active(profiler):
+    @profiler.track('work')
+    async def work():
+        return "done"
+
+    profiler.active = False
+    assert await work() == "done"
+    assert 'work' not in profiler.coroutine_stats
+
+@pytest.mark.asyncio
+async def test_start_keeps_task_and_writes_results(tmp_path):
+    profiler = AsyncProfiler()
+
+    @profiler.track('work')
+    async def work():
+        return "done"
+
+    with patch.object(profiling, 'PROFILE_DIR', str(tmp_path)):
+        task = profiler.start(0.05)
+        assert profiler.task is task
+        assert profiler.start(0.05) is None  # Already running
+        await asyncio.sleep(0.01)
+        await work()
+        await task
+
+    assert not profiler.active
+    (coroutines,) = glob.glob(str(tmp_path / '*-coroutines.json'))
+    with open(coroutines) as f:
+        assert json.load(f)['work']['calls'] == 1
+    assert glob.glob(str(tmp_path / '*.collapsed'))
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
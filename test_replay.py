@@ -0,0 +1,42 @@
+import pytest
+import cv2
+import numpy as np
+from datetime import datetime
+import sys
+import os
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import consumer
+import image_processing
+from frame_recorder import FrameRecorder
+from replay import replay, find_segments
+
+def frame_payload(camera_id, timestamp, img):
+    _, buffer = cv2.imencode('.jpg', img)
+    return str({'camera_id': camera_id, 'camera_index': 0, 'timestamp': timestamp.isoformat(),
+                'frame': buffer.tobytes()}).encode('utf-8')
+
+@pytest.mark.asyncio
+async def test_replay_recorded_frames(tmp_path):
+    empty = np.zeros((90, 160, 3), dtype=np.uint8)
+    person = empty.copy()
+    person[20:70, 40:120] = 255
+
+    recorder = FrameRecorder(str(tmp_path))
+    for second, img in enumerate([empty, person, person]):
+        recorder.record('AXIS_ID', frame_payload('AXIS_ID', datetime(2024, 1, 1, 12, 0, second), img), recorded_at=1000.0 + second)
+    recorder.close()
+
+    originals = (image_processing.process_image, consumer.store_results, consumer.update_timestamp, consumer.send_to_django)
+    result = await replay(find_segments([str(tmp_path)]))
+
+    # The first frame and the change are described, the unchanged frame only refreshes the timestamp
+    assert result['frames'] == 3
+    assert result['llm_calls'] == 2
+    assert result['recorded_seconds'] == 2.0
+    assert (image_processing.process_image, consumer.store_results, consumer.update_timestamp, consumer.send_to_django) == originals
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -1,7 +1,6 @@
 import pytest
 from unittest.mock import patch, MagicMock, AsyncMock
 from datetime import datetime, time
-import pytz
 import sys
 import os
 import json
@@ -9,7 +8,7 @@ import json
 # Add the current directory to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from scheduled_checks import check_curtains, check_presence, schedule_checks
+from scheduled_checks import CurtainCheckEngine, schedule_checks
 
 def test_sync():
     assert True
@@ -18,61 +17,127 @@ def test_sync():
 def redis_client():
     client = AsyncMock()
     client.rpush = AsyncMock()
+    client.set = AsyncMock(return_value=True)
     return client
 
+@pytest.fixture
+def engine():
+    return CurtainCheckEngine([("AXIS_ID", "12:33pm", "12:33", "12:38")])
+
+def today_at(hour, minute):
+    return datetime.combine(datetime.now(CurtainCheckEngine().tz).date(), time(hour, minute))
+
 @pytest.mark.asyncio
-async def test_check_curtains(redis_client):
-    with patch('scheduled_checks.get_latest_frame', new_callable=AsyncMock) as mock_get_frame, \
-         patch('scheduled_checks.process_image_for_curtains', new_callable=AsyncMock) as mock_process:
-        
-        # Setup
-        mock_get_frame.return_value = b'fake_image_data'
-        mock_process.return_value = 'yes'
+async def test_check_window_alerts_once_with_frame_reference(redis_client, engine):
+    window = engine.windows[0]
+    db_conn = MagicMock()
+    engine.observe('AXIS_ID', today_at(12, 34), 'A closed red curtain covers the altar.')
+    engine.observe('AXIS_ID', today_at(12, 35), 'A closed red curtain covers the altar.')
 
-        # Test
-        await check_curtains(redis_client, 'AXIS_ID', '12:33pm')
+    with patch('scheduled_checks.fetch_descriptions_for_timerange', new_callable=AsyncMock) as mock_fetch, \
+         patch('scheduled_checks.pin_latest_frame', new_callable=AsyncMock) as mock_frame_id:
+        mock_frame_id.return_value = 42
+
+        await engine.check_window(redis_client, db_conn, window)
+        await engine.check_window(redis_client, db_conn, window)
 
-        # Assert
-        redis_client.rpush.assert_called_once()
-        args = redis_client.rpush.call_args[0]
-        assert args[0] == 'alert_queue'
-        alert_data = json.loads(args[1])
-        assert 'Curtains are closed' in alert_data['message']
+        # Observed descriptions are used, no range query needed
+        mock_fetch.assert_not_called()
+        mock_frame_id.assert_called_once_with(db_conn, 'AXIS_ID')
+
+    redis_client.rpush.assert_called_once()
+    args = redis_client.rpush.call_args[0]
+    assert args[0] == 'alert_queue'
+    alert_data = json.loads(args[1])
+    assert 'Curtains are closed' in alert_data['message']
+    assert alert_data['frame_id'] == 42
+    assert 'frame' not in alert_data
 
 @pytest.mark.asyncio
-async def test_check_presence(redis_client):
+async def test_check_window_no_alert_when_deities_seen(redis_client, engine):
+    engine.observe('AXIS_ID', today_at(12, 34), 'A closed red curtain covers the altar.')
+    engine.observe('AXIS_ID', today_at(12, 36), 'Colorful deity statues on an altar.')
+    # Outside of the window, ignored
+    engine.observe('AXIS_ID', today_at(12, 40), 'A closed red curtain covers the altar.')
+
+    with patch('scheduled_checks.pin_latest_frame', new_callable=AsyncMock) as mock_frame_id:
+        await engine.check_window(redis_client, MagicMock(), engine.windows[0])
+        mock_frame_id.assert_not_called()
+
+    redis_client.rpush.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_check_window_falls_back_to_database(redis_client, engine):
     with patch('scheduled_checks.fetch_descriptions_for_timerange', new_callable=AsyncMock) as mock_fetch, \
-         patch('scheduled_checks.process_descriptions_for_presence', new_callable=AsyncMock) as mock_process, \
-         patch('scheduled_checks.get_latest_frame', new_callable=AsyncMock) as mock_get_frame:
-        
-        # Setup
-        mock_fetch.return_value = 'Sample descriptions'
-        mock_process.return_value = 'no'
-        mock_get_frame.return_value = b'fake_image_data'
+         patch('scheduled_checks.pin_latest_frame', new_callable=AsyncMock) as mock_frame_id:
+        mock_fetch.return_value = 'Sample descriptions of a curtain'
+        mock_frame_id.return_value = 7
 
-        # Test
-        await check_presence(redis_client, 'g8rHNVCflWO1ptKN', time(10,30), time(11,10))
+        await engine.check_window(redis_client, MagicMock(), engine.windows[0])
+
+        mock_fetch.assert_called_once()
+    redis_client.rpush.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_check_window_skips_alert_sent_by_other_instance(redis_client, engine):
+    redis_client.set.return_value = None
+    engine.observe('AXIS_ID', today_at(12, 34), 'A closed red curtain covers the altar.')
+
+    with patch('scheduled_checks.pin_latest_frame', new_callable=AsyncMock) as mock_frame_id:
+        await engine.check_window(redis_client, MagicMock(), engine.windows[0])
+        mock_frame_id.assert_not_called()
+
+    redis_client.rpush.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_check_window_retries_alert_after_push_failure(redis_client, engine):
+    window = engine.windows[0]
+    redis_client.rpush.side_effect = [ConnectionError("Redis went away"), 1]
+    engine.observe('AXIS_ID', today_at(12, 34), 'A closed red curtain covers the altar.')
+
+    with patch('scheduled_checks.pin_latest_frame', new_callable=AsyncMock, return_value=42), \
+         patch('scheduled_checks.asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
+        await engine.check_window(redis_client, MagicMock(), window)
+
+    # The failed attempt gave up its claim, so the retry could take it again
+    redis_client.delete.assert_called_once()
+    assert redis_client.set.call_count == 2
+    assert redis_client.rpush.call_count == 2
+    mock_sleep.assert_called_once()
+    assert window.alerted
+
+@pytest.mark.asyncio
+async def test_check_window_alerts_on_next_check_when_attempts_run_out(redis_client, engine):
+    window = engine.windows[0]
+    redis_client.rpush.side_effect = ConnectionError("Redis went away")
+    engine.observe('AXIS_ID', today_at(12, 34), 'A closed red curtain covers the altar.')
+
+    with patch('scheduled_checks.pin_latest_frame', new_callable=AsyncMock, return_value=42), \
+         patch('scheduled_checks.asyncio.sleep', new_callable=AsyncMock):
+        await engine.check_window(redis_client, MagicMock(), window)
+        assert not window.alerted
+
+        redis_client.rpush.side_effect = None
+        await engine.check_window(redis_client, MagicMock(), window)
 
-        # Assert
-        redis_client.rpush.assert_called_once()
-        args = redis_client.rpush.call_args[0]
-        assert args[0] == 'alert_queue'
-        alert_data = json.loads(args[1])
-        assert 'No single person detected' in alert_data['message']
+    assert window.alerted
+    assert redis_client.rpush.call_count == 4
 
 @pytest.mark.asyncio
 async def test_schedule_checks(redis_client):
     with patch('aiocron.crontab') as mock_crontab, \
-         patch('scheduled_checks.connect_redis', new_callable=AsyncMock) as mock_connect:
+         patch('scheduled_checks.resources') as mock_resources:
         
         # Setup
-        mock_connect.return_value = redis_client
+        mock_resources.connect = AsyncMock()
+        mock_resources.redis = redis_client
 
         # Test
         await schedule_checks()
 
-        # Assert
-        assert mock_crontab.call_count == 10  # 3 for curtains + 7 for presence
+        # Assert: one job per curtain window, fired the minute after it closes
+        assert mock_crontab.call_count == 3
+        assert mock_crontab.call_args_list[0][0][0] == '39 12 * * *'
 
 if __name__ == "__main__":
-    pytest.main([__file__, "-v"])
\ No newline at end of file
+    pytest.main([__file__, "-v"])
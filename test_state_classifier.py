@@ -0,0 +1,70 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+import sys
+import os
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import openai_operations
+from llm_cache import LLMCache
+from state_classifier import classify_by_rules, StateClassifier, agreement_report
+
+@pytest.mark.parametrize("description, expected", [
+    ("The image shows an empty room with chairs and a table.", "nothing"),
+    ("There are no people visible in the hallway.", "nothing"),
+    ("A statue of a man stands on the altar next to flowers.", "nothing"),
+    ("A man is standing near the door holding a broom.", "single person present"),
+    ("Someone is walking along the walkway.", "single person present"),
+    ("A group of people are sitting on the floor.", None),
+    ("A man and a woman are talking near the stage.", None),
+    ("Two women are walking toward the hall.", None),
+    ("A person is eating at a table.", None),
+    # Hyphenated and possessive words, and depictions, are left to the LLM
+    ("There is a man-made pond in the garden.", None),
+    ("There is a man's jacket on a chair.", None),
+    ("A woman's handbag lies on the table.", None),
+    ("A painting depicting a woman hangs on the wall.", None),
+    ("A poster of a man is on the door.", None),
+])
+def test_classify_by_rules(description, expected):
+    assert classify_by_rules(description) == expected
+
+def test_door_cameras_always_go_to_llm():
+    classifier = StateClassifier(model_path=None)
+    assert classifier.classify("OSF13XTCKhpIkyXc", "An empty cold storage room.") is None
+    assert classifier.classify("IOKAu7MMacLh79zn", "An empty temple room.") == "nothing"
+
+def test_agreement_report():
+    classifier = StateClassifier(model_path=None)
+    labels = [
+        ("IOKAu7MMacLh79zn", "An empty temple room.", "Nothing."),
+        ("IOKAu7MMacLh79zn", "A man is sweeping the floor.", "nothing"),
+        ("IOKAu7MMacLh79zn", "A crowd is dancing.", "bustling"),
+    ]
+    report = agreement_report(classifier, labels)
+    assert report['samples'] == 3
+    assert report['decided_locally'] == 2
+    assert report['agreement'] == 0.5
+
+@pytest.mark.asyncio
+async def test_only_llm_answers_are_recorded_as_labels():
+    completion = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="bustling, door open"))])
+    create = AsyncMock(return_value=completion)
+    snapshot = SimpleNamespace(is_quiet=lambda camera_id: False)
+    labels = []
+
+    with patch.object(openai_operations.client.chat.completions, 'create', create), \
+            patch.object(openai_operations, 'llm_cache', LLMCache()), \
+            patch.object(openai_operations, 'LLM_CACHE_ENABLED', True):
+        for _ in range(2):
+            state = await openai_operations.process_camera_state('oaQllpjP0sk94nCV', "People at the open door.", snapshot, labels)
+            assert state == "bustling, door open"
+
+    # The second pass was answered from the cache and must not add a duplicate training label
+    create.assert_called_once()
+    assert labels == [('oaQllpjP0sk94nCV', "People at the open door.", "bustling, door open")]
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,52 @@
+import pytest
+from datetime import datetime
+import sys
+import os
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from time_windows import ScheduleEngine, schedule_engine
+
+def at(weekday, hour, minute):
+    # 2024-01-01 was a Monday
+    return datetime(2024, 1, 1 + weekday, hour, minute)
+
+def legacy_axis_quiet(current_time):
+    # The hardcoded AXIS windows that used to live in process_camera_state
+    current_minutes = current_time.hour * 60 + current_time.minute
+    weekday = current_time.weekday()
+    time_windows = [(4*60 + 30, 5*60), (7*60 + 15, 12*60), (12*60 + 30, 13*60), (19*60, 20*60)]
+    if weekday > 5:
+        time_windows.append((13*60, 16*60))
+    if weekday < 6:
+        time_windows.append((16*60 + 15, 17*60 + 45))
+    else:
+        time_windows.append((16*60, 16*60 + 30))
+    return any(start <= current_minutes <= end for start, end in time_windows)
+
+def legacy_night_time(current_time):
+    return 20 <= current_time.hour or current_time.hour < 3
+
+def test_matches_legacy_rules_for_every_minute_of_the_week():
+    for weekday in range(7):
+        for hour in range(24):
+            for minute in range(60):
+                snapshot = schedule_engine.snapshot(at(weekday, hour, minute))
+                assert snapshot.is_quiet("AXIS_ID") == legacy_axis_quiet(snapshot.current_time)
+                assert snapshot.is_night_time == legacy_night_time(snapshot.current_time)
+                assert not snapshot.is_quiet("IOKAu7MMacLh79zn")
+
+def test_window_crossing_midnight_wraps_to_next_day():
+    engine = ScheduleEngine({"cam": [("23:00", "01:00", [6])]}, [], 'UTC')
+    assert engine.snapshot(at(6, 23, 30)).is_quiet("cam")
+    assert engine.snapshot(at(0, 0, 30)).is_quiet("cam")
+    assert not engine.snapshot(at(0, 1, 1)).is_quiet("cam")
+    assert not engine.snapshot(at(5, 23, 30)).is_quiet("cam")
+
+def test_adjacent_equal_segments_are_merged():
+    engine = ScheduleEngine({"cam": [("10:00", "11:00", range(7))]}, [], 'UTC')
+    assert len(engine.boundaries) == len(engine.segments) == 15
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
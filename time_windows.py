@@ -0,0 +1,85 @@
+from bisect import bisect_right
+from datetime import datetime
+import pytz
+from config import TIME_ZONE, QUIET_WINDOWS, NIGHT_TIME_WINDOWS
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+ALL_DAYS = tuple(range(7))
+
+NIGHT_TIME = ('night', None)
+
+
+def parse_minutes(hhmm):
+    hour, minute = hhmm.split(':')
+    return int(hour) * 60 + int(minute)
+
+
+def expand_window(start, end, weekdays):
+    # Yield inclusive (start, end) minute-of-week intervals, splitting windows that cross midnight
+    start_minutes, end_minutes = parse_minutes(start), parse_minutes(end)
+    for weekday in weekdays:
+        day_offset = weekday * MINUTES_PER_DAY
+        if start_minutes <= end_minutes:
+            yield day_offset + start_minutes, day_offset + end_minutes
+        else:
+            yield day_offset + start_minutes, day_offset + MINUTES_PER_DAY - 1
+            next_day_offset = ((weekday + 1) % 7) * MINUTES_PER_DAY
+            yield next_day_offset, next_day_offset + end_minutes
+
+
+class ScheduleSnapshot:
+    def __init__(self, current_time, active_rules):
+        self.current_time = current_time
+        self.active_rules = active_rules
+
+    def is_quiet(self, camera_id):
+        return ('quiet', camera_id) in self.active_rules
+
+    @property
+    def is_night_time(self):
+        return NIGHT_TIME in self.active_rules
+
+
+class ScheduleEngine:
+    def __init__(self, quiet_windows, night_time_windows, time_zone):
+        self.tz = pytz.timezone(time_zone)
+        intervals = []
+        for camera_id, windows in quiet_windows.items():
+            for start, end, weekdays in windows:
+                for interval in expand_window(start, end, weekdays):
+                    intervals.append((interval, ('quiet', camera_id)))
+        for start, end in night_time_windows:
+            for interval in expand_window(start, end, ALL_DAYS):
+                intervals.append((interval, NIGHT_TIME))
+        self.boundaries, self.segments = self.compile(intervals)
+
+    @staticmethod
+    def compile(intervals):
+        # Cut the week at every interval edge and precompute the rules active in each segment
+        edges = {0}
+        for (start, end), _ in intervals:
+            edges.add(start)
+            edges.add(end + 1)
+        boundaries = sorted(edge for edge in edges if edge < MINUTES_PER_WEEK)
+        segments = []
+        for index, boundary in enumerate(boundaries):
+            active = frozenset(rule for (start, end), rule in intervals if start <= boundary <= end)
+            if segments and segments[-1] == active:
+                # Merge with the previous segment so lookups stay on the smallest index
+                boundaries[index] = None
+                continue
+            segments.append(active)
+        return [boundary for boundary in boundaries if boundary is not None], segments
+
+    def rules_at(self, minute_of_week):
+        return self.segments[bisect_right(self.boundaries, minute_of_week) - 1]
+
+    def snapshot(self, current_time=None):
+        if current_time is None:
+            current_time = datetime.now(self.tz)
+        minute_of_week = current_time.weekday() * MINUTES_PER_DAY + current_time.hour * 60 + current_time.minute
+        return ScheduleSnapshot(current_time, self.rules_at(minute_of_week))
+
+
+schedule_engine = ScheduleEngine(QUIET_WINDOWS, NIGHT_TIME_WINDOWS, TIME_ZONE)